@@ -6,13 +6,16 @@ from key import OR_key
 OPENROUTER_API_KEY = OR_key # Keep this secure! Use environment variables ideally.
 YOUR_SITE_URL = "http://localhost:8000" # Or your app name/URL
 YOUR_APP_NAME = "GLaDOS_Assistant"
+# Any OpenAI-compatible endpoint works, e.g. a local llama.cpp server: "http://localhost:8080/v1"
+LLM_BASE_URL = "https://openrouter.ai/api/v1"
+LLM_MODEL = "google/gemini-2.0-flash-001" # Or your chosen model
 
 # Function to call the LLM API with conversation history
 def get_llm_response(conversation_history, system_message):
     messages_payload = [{"role": "system", "content": system_message}] + list(conversation_history)
     try:
         response = requests.post(
-            url="https://openrouter.ai/api/v1/chat/completions",
+            url=f"{LLM_BASE_URL}/chat/completions",
             headers={
                 "Authorization": f"Bearer {OPENROUTER_API_KEY}",
                 # Optional headers for identification/tracking
@@ -20,7 +23,7 @@ def get_llm_response(conversation_history, system_message):
                 # "X-Title": YOUR_APP_NAME,
             },
             data=json.dumps({
-                "model": "google/gemini-2.0-flash-001", # Or your chosen model
+                "model": LLM_MODEL,
                 "messages": messages_payload
             })
         )
@@ -0,0 +1,292 @@
+# audio_dsp.py
+# In-process, chunk-streaming post-processing for synthesized speech.
+# Sits between Piper and the playback engine: silence trimming, gain normalization,
+# a light ring-mod "robotic" effect, and resampling to the output device rate.
+# Everything is vectorized NumPy on preallocated buffers - no per-sample Python loops
+# and no copies of the full clip - so each chunk costs well under a millisecond.
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+    print("Warning: 'numpy' library not found. Audio post-processing disabled.")
+    print("Install with: pip install numpy")
+
+# --- Configuration ---
+# Audio is processed in blocks of this many input samples. Larger chunks are split.
+CHUNK_SAMPLES = 2048
+
+# Gain normalization: chunk peaks are pushed towards this level (0.0 - 1.0 of full scale).
+TARGET_PEAK = 0.8
+MAX_GAIN = 4.0 # Never amplify more than this (keeps breaths and noise from blowing up)
+GAIN_SMOOTHING = 0.3 # 0 = frozen gain, 1 = jump straight to each chunk's ideal gain
+
+# Ring modulation: output = dry * ((1 - mix) + mix * sin(2*pi*freq*t)).
+RING_MOD_FREQ = 30.0 # Hz. Low values give the classic synthetic warble
+RING_MOD_MIX = 0.2 # 0 disables the effect
+
+# Silence trimming at the start and end of each utterance.
+SILENCE_THRESHOLD = 0.01 # Absolute amplitude below which a sample counts as silence
+KEEP_SILENCE_MS = 40 # Leave this much of the trimmed silence in place so words aren't clipped
+MAX_HOLD_MS = 400 # Pauses longer than this are shortened to it (also bounds the hold buffer)
+
+
+class DSPChain:
+    """
+    Streaming post-processor for int16 mono PCM.
+    Call process()/process_iter() for each chunk of an utterance and flush() at its end.
+    State (gain, ring-mod phase, resampler position) carries across chunks, so chunk
+    boundaries are inaudible.
+    """
+
+    def __init__(self, in_rate, out_rate=None, chunk_samples=CHUNK_SAMPLES,
+                 target_peak=TARGET_PEAK, max_gain=MAX_GAIN, gain_smoothing=GAIN_SMOOTHING,
+                 ring_mod_freq=RING_MOD_FREQ, ring_mod_mix=RING_MOD_MIX,
+                 silence_threshold=SILENCE_THRESHOLD, keep_silence_ms=KEEP_SILENCE_MS,
+                 max_hold_ms=MAX_HOLD_MS):
+        if not NUMPY_AVAILABLE:
+            raise RuntimeError("DSPChain requires numpy.")
+        self.in_rate = in_rate
+        self.out_rate = out_rate or in_rate
+        self.chunk = chunk_samples
+        self.target_peak = target_peak
+        self.max_gain = max_gain
+        self.gain_smoothing = gain_smoothing
+        self.ring_mod_mix = ring_mod_mix
+        self.silence_threshold = silence_threshold
+        self.keep_silence = int(in_rate * keep_silence_ms / 1000)
+        self.max_hold = max(int(in_rate * max_hold_ms / 1000), self.keep_silence)
+
+        # Ring modulator phase increment per input sample
+        self._phase_step = 2 * np.pi * ring_mod_freq / in_rate
+        # Resampler: step in input samples per output sample
+        self._ratio = self.in_rate / self.out_rate
+        max_out = int(np.ceil((self.chunk + self.max_hold + 1) / self._ratio)) + 2
+
+        # --- Preallocated work buffers ---
+        work_len = self.chunk + self.max_hold
+        self._work = np.zeros(work_len + 1, dtype=np.float32) # [prev sample | held silence | chunk]
+        self._tmp = np.empty(work_len, dtype=np.float32)
+        self._index = np.arange(work_len, dtype=np.float32)
+        self._loud = np.empty(work_len, dtype=bool)
+        self._out_pos = np.empty(max_out, dtype=np.float64)
+        self._out_idx = np.empty(max_out, dtype=np.intp)
+        self._out_frac = np.empty(max_out, dtype=np.float32)
+        self._out = np.empty(max_out, dtype=np.float32)
+        self._out_next = np.empty(max_out, dtype=np.float32)
+        self._out_int = np.empty(max_out, dtype=np.int16)
+        self._out_steps = np.arange(max_out, dtype=np.float64)
+
+        self.reset()
+
+    def reset(self):
+        """Prepares for a new utterance (re-arms leading silence trimming, clears held audio)."""
+        self._gain = 1.0
+        self._phase = 0.0
+        self._resample_pos = 0.0 # Position of the next output sample, relative to _work[0]
+        self._work[0] = 0.0
+        self._held = 0 # Samples of trailing silence currently held back in _work[1:]
+        self._started = False # False until the first non-silent sample of the utterance
+
+    # --- Public API ---
+    def process(self, pcm_bytes):
+        """Processes a chunk of int16 PCM and returns the processed int16 PCM bytes."""
+        return b"".join(self.process_iter(pcm_bytes))
+
+    def process_iter(self, pcm_bytes):
+        """Like process(), but yields output block by block (lower latency for long inputs)."""
+        samples = np.frombuffer(pcm_bytes, dtype=np.int16) # View, no copy
+        for start in range(0, len(samples), self.chunk):
+            out = self._process_block(samples[start:start + self.chunk])
+            if out:
+                yield out
+
+    def flush(self):
+        """Ends the utterance: drops trailing silence (keeping a short tail) and resets state."""
+        keep = min(self._held, self.keep_silence) if self._started else 0
+        out = self._render(keep, final=True) if keep else b""
+        self.reset()
+        return out
+
+    # --- Internals ---
+    def _process_block(self, block):
+        n = len(block)
+        if n == 0:
+            return b""
+        held = self._held
+        dry = self._work[1 + held:1 + held + n]
+        np.multiply(block, 1.0 / 32768, out=dry, casting="unsafe")
+
+        # Find the first and last samples above the silence threshold
+        tmp = self._tmp[:n]
+        np.abs(dry, out=tmp)
+        loud = self._loud[:n]
+        np.greater(tmp, self.silence_threshold, out=loud)
+        if not loud.any():
+            if not self._started:
+                return b"" # Still in leading silence: drop it
+            return self._hold_silence(n)
+        first = int(np.argmax(loud))
+        last = n - 1 - int(np.argmax(loud[::-1]))
+        # Before any trimming below: tmp and first/last index the untrimmed block
+        peak = float(tmp[first:last + 1].max()) if self.target_peak else 0.0
+
+        if not self._started:
+            # Trim leading silence, keeping a short lead-in
+            skip = max(0, first - self.keep_silence)
+            if skip:
+                dry[:n - skip] = dry[skip:]
+                n -= skip
+                last -= skip
+            self._started = True
+
+        self._apply_gain_and_ring_mod(held, n, peak)
+
+        # Hold back trailing silence; if the utterance ends here it will be trimmed
+        trailing = min(n - 1 - last, self.max_hold)
+        emit = held + n - trailing
+        out = self._render(emit)
+        self._keep_tail(trailing)
+        return out
+
+    def _hold_silence(self, n):
+        """Adds a silent block to the hold buffer. Silence beyond MAX_HOLD_MS is dropped."""
+        self._apply_gain_and_ring_mod(self._held, n, 0.0)
+        self._keep_tail(min(self._held + n, self.max_hold))
+        return b""
+
+    def _keep_tail(self, count):
+        """Moves the last `count` samples of the current window to the front of the hold buffer."""
+        if count:
+            end = 1 + self._window_len
+            self._work[1:1 + count] = self._work[end - count:end]
+        self._held = count
+
+    def _apply_gain_and_ring_mod(self, offset, n, peak):
+        """Applies a smoothed gain ramp and the ring modulator to _work[1+offset : 1+offset+n]."""
+        self._window_len = offset + n
+        seg = self._work[1 + offset:1 + offset + n]
+        tmp = self._tmp[:n]
+
+        if self.target_peak and peak > self.silence_threshold:
+            ideal = min(self.max_gain, self.target_peak / peak)
+            new_gain = self._gain + (ideal - self._gain) * self.gain_smoothing
+        else:
+            new_gain = self._gain
+        # Linear ramp from the previous gain to the new one avoids zipper noise
+        np.multiply(self._index[:n], (new_gain - self._gain) / max(n - 1, 1), out=tmp)
+        tmp += self._gain
+        seg *= tmp
+        self._gain = new_gain
+
+        if self.ring_mod_mix:
+            np.multiply(self._index[:n], self._phase_step, out=tmp)
+            tmp += self._phase
+            np.sin(tmp, out=tmp)
+            tmp *= self.ring_mod_mix
+            tmp += 1.0 - self.ring_mod_mix
+            seg *= tmp
+            self._phase = (self._phase + n * self._phase_step) % (2 * np.pi)
+
+    def _render(self, count, final=False):
+        """
+        Resamples the first `count` samples of the window (after the previous-sample slot)
+        to the output rate, converts to int16 and returns bytes. Shifts the resampler state.
+        """
+        if count <= 0:
+            return b""
+        src = self._work[:count + 1] # [prev sample, count new samples]
+        if self._ratio == 1.0:
+            out = self._out[:count]
+            np.clip(src[1:], -1.0, 1.0, out=out)
+        else:
+            # Output positions fall in [pos, count]; position 0 is the previous sample
+            m = int(np.floor((count - self._resample_pos) / self._ratio)) + 1
+            m = max(0, min(m, self._out.shape[0]))
+            pos = self._out_pos[:m]
+            np.multiply(self._out_steps[:m], self._ratio, out=pos)
+            pos += self._resample_pos
+            idx = self._out_idx[:m]
+            np.copyto(idx, pos, casting="unsafe") # Truncation == floor for positive positions
+            np.minimum(idx, count - 1, out=idx)
+            frac = self._out_frac[:m]
+            np.subtract(pos, idx, out=frac, casting="unsafe")
+            # out = src[idx] + (src[idx + 1] - src[idx]) * frac
+            out = self._out[:m]
+            nxt = self._out_next[:m]
+            np.take(src, idx, out=out)
+            np.take(src[1:], idx, out=nxt)
+            nxt -= out
+            nxt *= frac
+            out += nxt
+            np.clip(out, -1.0, 1.0, out=out)
+            self._resample_pos = float(self._resample_pos + m * self._ratio - count)
+
+        # Remember the last rendered sample as the interpolation anchor for the next call
+        self._work[0] = src[count]
+        out_int = self._out_int[:len(out)]
+        np.multiply(out, 32767, out=out)
+        np.copyto(out_int, out, casting="unsafe")
+        if final:
+            self._resample_pos = 0.0
+        return out_int.tobytes()
+
+
+# --- Microbenchmark ---
+# Usage: python audio_dsp.py
+# Feeds synthetic speech-like audio through the chain in Piper-sized chunks and reports throughput.
+def benchmark(in_rate=22050, out_rate=48000, seconds=30.0, chunk_bytes=4096):
+    import time
+    rng = np.random.default_rng(0)
+    n = int(in_rate * seconds)
+    t = np.arange(n) / in_rate
+    # Voiced tone with a syllable-rate envelope and gaps of silence, plus a little noise
+    envelope = np.clip(np.sin(2 * np.pi * 3 * t), 0, None)
+    signal = 0.3 * envelope * np.sin(2 * np.pi * 180 * t) + 0.002 * rng.standard_normal(n)
+    pcm = (signal * 32767).astype(np.int16).tobytes()
+
+    chain = DSPChain(in_rate, out_rate)
+    chain.process(pcm[:chunk_bytes]) # Warm-up
+    chain.reset()
+
+    chunks = 0
+    out_bytes = 0
+    start = time.perf_counter()
+    for offset in range(0, len(pcm), chunk_bytes):
+        out_bytes += len(chain.process(pcm[offset:offset + chunk_bytes]))
+        chunks += 1
+    out_bytes += len(chain.flush())
+    elapsed = time.perf_counter() - start
+
+    print(f"DSP chain {in_rate} Hz -> {out_rate} Hz, {seconds:.0f} s of audio in {chunks} chunks of {chunk_bytes // 2} samples")
+    print(f"  Throughput: {n / elapsed:,.0f} samples/s ({n / elapsed / in_rate:,.0f}x real time)")
+    print(f"  Per chunk:  {elapsed / chunks * 1000:.3f} ms")
+    print(f"  Output:     {out_bytes // 2:,} samples ({out_bytes / 2 / out_rate:.2f} s after silence trimming)")
+
+
+def self_test(in_rate=22050):
+    """Edge cases the benchmark's signal (loud from t=0) doesn't reach."""
+    lead_in = int(in_rate * KEEP_SILENCE_MS / 1000)
+    # Speech starting mid-block, further in than the kept lead-in
+    block = np.zeros(CHUNK_SAMPLES, dtype=np.int16)
+    block[1500:] = 8000
+    chain = DSPChain(in_rate)
+    out = np.frombuffer(chain.process(block.tobytes()) + chain.flush(), dtype=np.int16)
+    assert len(out) == CHUNK_SAMPLES - 1500 + lead_in, len(out)
+    assert not out[:lead_in].any() and out[lead_in:].any(), "lead-in or onset misplaced"
+    # Gain moves toward TARGET_PEAK from the loud part's level, without overshooting it
+    assert 8000 < int(np.abs(out).max()) <= TARGET_PEAK * 32767, int(np.abs(out).max())
+    # Onset in a later block, after a fully silent one
+    chain.reset()
+    out = chain.process(np.zeros(CHUNK_SAMPLES, dtype=np.int16).tobytes()) + chain.process(block.tobytes())
+    assert len(out) // 2 == CHUNK_SAMPLES - 1500 + lead_in, len(out) // 2
+    print("Self-test passed.")
+
+
+if __name__ == '__main__':
+    if not NUMPY_AVAILABLE:
+        raise SystemExit("numpy is required for the benchmark.")
+    self_test()
+    benchmark()
+    benchmark(out_rate=22050)
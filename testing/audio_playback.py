@@ -0,0 +1,387 @@
+# audio_playback.py
+# Persistent streaming audio output engine.
+# Keeps ONE output stream open, plays a queue of 16-bit PCM buffers back to back (no gaps,
+# no per-clip device/decoder setup) and can be cancelled mid-sentence (barge-in).
+
+import threading
+import time
+import wave
+import atexit
+from collections import deque
+
+try:
+    import sounddevice
+    SOUNDDEVICE_AVAILABLE = True
+except ImportError:
+    SOUNDDEVICE_AVAILABLE = False
+
+# --- Configuration ---
+# Which sink the default engine uses: "sounddevice", "wav" or "null".
+# Falls back to "null" if sounddevice is not installed (e.g. headless CI).
+# Install with: pip install sounddevice
+DEFAULT_SINK = "sounddevice"
+DEFAULT_WAV_PATH = "playback_output.wav" # Only used by the "wav" sink
+
+# Audio is written to the sink in blocks of this length. Smaller blocks = faster barge-in.
+BLOCK_MS = 40
+
+SAMPLE_WIDTH = 2 # Bytes per sample (int16)
+
+
+# --- Sinks ---
+# A sink needs: open(sample_rate, channels), write(pcm_bytes), abort(), close().
+# write() should block for roughly the duration of the audio, like a real device would.
+
+class SoundDeviceSink:
+    """Plays audio through a single long-lived sounddevice raw output stream."""
+
+    def __init__(self, latency="low"):
+        self.latency = latency
+        self.stream = None
+
+    def open(self, sample_rate, channels):
+        self.close()
+        self.stream = sounddevice.RawOutputStream(samplerate=sample_rate, channels=channels,
+                                                  dtype="int16", latency=self.latency)
+        self.stream.start()
+
+    def write(self, pcm_bytes):
+        if self.stream:
+            self.stream.write(pcm_bytes)
+
+    def abort(self):
+        """Drops whatever the device still has buffered, then resumes the stream."""
+        if self.stream:
+            self.stream.abort()
+            self.stream.start()
+
+    def close(self):
+        if self.stream:
+            try:
+                self.stream.stop()
+                self.stream.close()
+            except Exception:
+                pass
+            self.stream = None
+
+
+class WavFileSink:
+    """Writes everything played into one WAV file. Useful for checking output on headless machines."""
+
+    def __init__(self, path=DEFAULT_WAV_PATH, realtime=False):
+        self.path = path
+        self.realtime = realtime # Sleep like a device would, so timing behaves the same
+        self.wav = None
+        self.bytes_per_second = 0
+
+    def open(self, sample_rate, channels):
+        self.close()
+        self.wav = wave.open(self.path, "wb")
+        self.wav.setnchannels(channels)
+        self.wav.setsampwidth(SAMPLE_WIDTH)
+        self.wav.setframerate(sample_rate)
+        self.bytes_per_second = sample_rate * channels * SAMPLE_WIDTH
+
+    def write(self, pcm_bytes):
+        if self.wav:
+            self.wav.writeframes(pcm_bytes)
+            if self.realtime and self.bytes_per_second:
+                time.sleep(len(pcm_bytes) / self.bytes_per_second)
+
+    def abort(self):
+        pass
+
+    def close(self):
+        if self.wav:
+            self.wav.close()
+            self.wav = None
+
+
+class NullSink:
+    """Discards audio. With realtime=True it still takes as long as the audio would."""
+
+    def __init__(self, realtime=False):
+        self.realtime = realtime
+        self.bytes_per_second = 0
+
+    def open(self, sample_rate, channels):
+        self.bytes_per_second = sample_rate * channels * SAMPLE_WIDTH
+
+    def write(self, pcm_bytes):
+        if self.realtime and self.bytes_per_second:
+            time.sleep(len(pcm_bytes) / self.bytes_per_second)
+
+    def abort(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def create_sink(kind=None):
+    """Builds a sink by name, falling back to NullSink if the requested backend is unavailable."""
+    kind = kind or DEFAULT_SINK
+    if kind == "sounddevice":
+        if SOUNDDEVICE_AVAILABLE:
+            return SoundDeviceSink()
+        print("Warning: 'sounddevice' library not found. Install with 'pip install sounddevice'. Audio output disabled.")
+        return NullSink()
+    if kind == "wav":
+        return WavFileSink()
+    return NullSink()
+
+
+# --- Playback Engine ---
+
+class PlaybackEngine:
+    """
+    Plays queued PCM buffers gaplessly on a background thread.
+    Producers call enqueue() as audio becomes available and end_stream() once an utterance is
+    complete. cancel() flushes everything (barge-in). Running out of audio before end_stream()
+    is counted as an underrun.
+    """
+
+    def __init__(self, sink=None, sample_rate=22050, channels=1, block_ms=BLOCK_MS):
+        self.sink = sink or create_sink()
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.block_ms = block_ms
+
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._sink_lock = threading.Lock() # Serializes sink writes with abort/reopen/close
+        self._generation = 0 # Bumped on cancel, so in-flight audio from before is dropped
+        self._stream_open = False # True between the first enqueue() and end_stream()
+        self._claim = None # (owner, on_preempt) while low-priority audio (filler) is playing
+        self._playing = False
+        self._running = False
+        self._thread = None
+        self._sink_opened = False
+
+        # Stats
+        self.underruns = 0
+        self.cancels = 0
+        self.played_bytes = 0
+        self.max_queue_bytes = 0
+        self._queued_bytes = 0
+
+    # --- Lifecycle ---
+    def start(self):
+        """Opens the sink and starts the playback thread (idempotent)."""
+        if self._running:
+            return
+        self.sink.open(self.sample_rate, self.channels)
+        self._sink_opened = True
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="PlaybackEngine", daemon=True)
+        self._thread.start()
+
+    def close(self, drain_timeout=None):
+        """Optionally waits for queued audio, then stops the thread and closes the sink."""
+        if drain_timeout:
+            self.wait(timeout=drain_timeout)
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        if self._thread:
+            self._thread.join(timeout=1.0)
+        with self._sink_lock:
+            if self._sink_opened:
+                self.sink.close()
+                self._sink_opened = False
+
+    # --- Producer API ---
+    def set_sample_rate(self, sample_rate):
+        """Reopens the sink if the incoming audio uses a different rate. Flushes pending audio."""
+        if sample_rate == self.sample_rate:
+            return
+        self.cancel()
+        with self._cond, self._sink_lock:
+            self.sample_rate = sample_rate
+            if self._sink_opened:
+                self.sink.open(self.sample_rate, self.channels)
+
+    def claim(self, owner, on_preempt):
+        """
+        Marks the audio owner is about to queue as low priority (e.g. filler while waiting).
+        The first enqueue() from anyone else calls on_preempt() before its audio is queued,
+        so the owner can wrap up (fade out) right where the real audio starts.
+        """
+        with self._cond:
+            self._claim = (owner, on_preempt)
+
+    def release(self, owner):
+        """Drops owner's claim, if it still holds one."""
+        with self._cond:
+            if self._claim and self._claim[0] is owner:
+                self._claim = None
+
+    def enqueue(self, pcm_bytes, owner=None):
+        """Adds raw int16 PCM audio to the playback queue. Returns the current generation."""
+        if not self._running:
+            self.start()
+        preempted = None
+        with self._cond:
+            if self._claim and self._claim[0] is not owner:
+                preempted, self._claim = self._claim, None
+        if preempted:
+            preempted[1]() # Outside the lock: the owner enqueues its last audio from here
+        with self._cond:
+            if pcm_bytes:
+                self._queue.append((self._generation, pcm_bytes))
+                self._queued_bytes += len(pcm_bytes)
+                self.max_queue_bytes = max(self.max_queue_bytes, self._queued_bytes)
+            self._stream_open = True
+            self._cond.notify_all()
+            return self._generation
+
+    def end_stream(self):
+        """Marks the current utterance as complete. An empty queue after this is not an underrun."""
+        with self._cond:
+            self._stream_open = False
+            self._cond.notify_all()
+
+    def play(self, pcm_bytes):
+        """Queues a complete clip."""
+        self.enqueue(pcm_bytes)
+        self.end_stream()
+
+    def cancel(self):
+        """Stops playback immediately and drops everything queued (barge-in)."""
+        with self._cond:
+            was_active = self._playing or bool(self._queue)
+            self._generation += 1
+            self._claim = None
+            self._queue.clear()
+            self._queued_bytes = 0
+            self._stream_open = False
+            self._cond.notify_all()
+        if was_active:
+            self.cancels += 1
+            try:
+                # Sinks aren't thread-safe: wait for the worker's current write (at most one block)
+                with self._sink_lock:
+                    self.sink.abort()
+            except Exception as e:
+                print(f"Warning: Audio sink abort failed: {e}")
+
+    @property
+    def generation(self):
+        return self._generation
+
+    # --- State ---
+    def is_busy(self):
+        """True while audio is queued, playing, or an utterance is still being produced."""
+        with self._cond:
+            return self._playing or bool(self._queue) or self._stream_open
+
+    def wait(self, timeout=None):
+        """Blocks until all queued audio has been played. Returns False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._playing or self._queue or self._stream_open:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(timeout=remaining if remaining is not None else 0.1)
+        return True
+
+    def queue_depth_ms(self):
+        """Milliseconds of audio waiting in the queue."""
+        bytes_per_ms = self.sample_rate * self.channels * SAMPLE_WIDTH / 1000
+        return self._queued_bytes / bytes_per_ms if bytes_per_ms else 0.0
+
+    def stats(self):
+        """Returns a dictionary of playback statistics."""
+        bytes_per_ms = self.sample_rate * self.channels * SAMPLE_WIDTH / 1000
+        with self._cond:
+            return {
+                "queue_buffers": len(self._queue),
+                "queue_ms": round(self._queued_bytes / bytes_per_ms, 1),
+                "max_queue_ms": round(self.max_queue_bytes / bytes_per_ms, 1),
+                "played_ms": round(self.played_bytes / bytes_per_ms, 1),
+                "underruns": self.underruns,
+                "cancels": self.cancels,
+            }
+
+    # --- Worker ---
+    def _run(self):
+        starved = False
+        while True:
+            with self._cond:
+                while self._running and not self._queue:
+                    if self._playing and self._stream_open and not starved:
+                        # Producer promised more audio but we ran dry mid-utterance
+                        starved = True
+                        self.underruns += 1 # Counted silently (reported by stats()); a print would land in the input prompt
+                    if not self._stream_open:
+                        self._playing = False
+                        self._cond.notify_all()
+                    self._cond.wait(timeout=0.1)
+                if not self._running:
+                    self._playing = False
+                    self._cond.notify_all()
+                    return
+                generation, pcm = self._queue.popleft()
+                self._queued_bytes -= len(pcm)
+                self._playing = True
+                starved = False
+
+            # Write in small blocks so cancel() takes effect within one block
+            frame_bytes = SAMPLE_WIDTH * self.channels
+            block_bytes = max(frame_bytes, int(self.sample_rate * self.block_ms / 1000) * frame_bytes)
+            for offset in range(0, len(pcm), block_bytes):
+                if generation != self._generation:
+                    break
+                block = pcm[offset:offset + block_bytes]
+                try:
+                    with self._sink_lock:
+                        self.sink.write(block)
+                except Exception as e:
+                    print(f"Warning: Audio sink write failed: {e}")
+                    break
+                self.played_bytes += len(block)
+
+
+# --- Shared Engine ---
+_default_engine = None
+_default_engine_lock = threading.Lock()
+
+
+def get_engine(sample_rate=None):
+    """Returns the process-wide playback engine, creating it on first use."""
+    global _default_engine
+    with _default_engine_lock:
+        if _default_engine is None:
+            _default_engine = PlaybackEngine(sample_rate=sample_rate or 22050)
+            _default_engine.start()
+            atexit.register(_default_engine.close, drain_timeout=30)
+    if sample_rate:
+        _default_engine.set_sample_rate(sample_rate)
+    return _default_engine
+
+
+# --- Self-test (runs headless) ---
+if __name__ == '__main__':
+    import math
+    import struct
+
+    def _tone(freq, seconds, rate=22050):
+        n = int(rate * seconds)
+        return struct.pack(f"<{n}h", *(int(8000 * math.sin(2 * math.pi * freq * i / rate)) for i in range(n)))
+
+    engine = PlaybackEngine(sink=WavFileSink("playback_selftest.wav", realtime=True), sample_rate=22050)
+    engine.start()
+    for f in (440, 550, 660):
+        engine.enqueue(_tone(f, 0.3))
+    engine.end_stream()
+    engine.wait()
+    print("Gapless playback:", engine.stats())
+
+    engine.play(_tone(330, 2.0))
+    time.sleep(0.2)
+    t0 = time.perf_counter()
+    engine.cancel()
+    engine.wait()
+    print(f"Barge-in stopped playback in {(time.perf_counter() - t0) * 1000:.1f} ms:", engine.stats())
+    engine.close()
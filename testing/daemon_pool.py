@@ -0,0 +1,69 @@
+# daemon_pool.py
+# A minimal thread pool whose workers are daemon threads.
+# concurrent.futures.ThreadPoolExecutor joins its workers at interpreter exit, so one call hung
+# on a stale mount or a dead D-Bus keeps the whole program from exiting. These workers are simply
+# abandoned at exit instead. submit() returns ordinary concurrent.futures.Future objects, so
+# future.result(timeout=...) and concurrent.futures.wait() work as usual.
+
+import queue
+import threading
+from concurrent.futures import Future
+
+
+class DaemonThreadPool:
+    """Drop-in for the parts of ThreadPoolExecutor used here: submit() and shutdown()."""
+
+    def __init__(self, max_workers, thread_name_prefix="DaemonWorker"):
+        self.max_workers = max_workers
+        self.thread_name_prefix = thread_name_prefix
+        self._work = queue.SimpleQueue() # (future, fn, args, kwargs), or None to stop a worker
+        self._idle = threading.Semaphore(0) # Released by each worker that is waiting for work
+        self._threads = []
+        self._lock = threading.Lock()
+        self._shutdown = False
+
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        with self._lock:
+            if self._shutdown:
+                raise RuntimeError("cannot submit after shutdown")
+            self._work.put((future, fn, args, kwargs))
+            # Reuse an idle worker if there is one; otherwise start another, up to max_workers
+            if not self._idle.acquire(blocking=False) and len(self._threads) < self.max_workers:
+                thread = threading.Thread(target=self._worker, daemon=True,
+                                          name=f"{self.thread_name_prefix}_{len(self._threads)}")
+                self._threads.append(thread)
+                thread.start()
+        return future
+
+    def _worker(self):
+        while True:
+            item = self._work.get()
+            if item is None:
+                return
+            future, fn, args, kwargs = item
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(fn(*args, **kwargs))
+                except BaseException as e:
+                    future.set_exception(e)
+            del item, future # Don't keep the last result alive while idle
+            self._idle.release()
+
+    def shutdown(self, wait=False, cancel_futures=False):
+        """Stops the workers once their current task is done. Hung tasks are not waited for unless wait=True."""
+        with self._lock:
+            self._shutdown = True
+            if cancel_futures:
+                while True:
+                    try:
+                        item = self._work.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is not None:
+                        item[0].cancel()
+            for _ in self._threads:
+                self._work.put(None)
+        if wait:
+            for thread in self._threads:
+                thread.join()
@@ -0,0 +1,324 @@
+# intent_router.py
+# Small local intent classifier that sits in front of the LLM.
+# Trivial, parameterless tool requests ("what's the date?") are answered locally;
+# everything else falls through to get_llm_response().
+
+import re
+import time
+import json
+
+# --- Configuration ---
+# Minimum confidence (0.0 - 1.0) required before a request is handled locally.
+# Raise it if the router steals requests that should go to the LLM, lower it to route more locally.
+CONFIDENCE_THRESHOLD = 0.75
+
+# Requests longer than this (in words) are probably not "trivial" and get penalized.
+MAX_TRIVIAL_WORDS = 10
+
+# Where route decisions are appended (one JSON object per line). Set to None to disable.
+ROUTER_LOG_FILE = "intent_router_log.jsonl"
+
+# Print each decision to the console as well.
+ROUTER_VERBOSE = True
+
+# --- Intent Rules ---
+# Only tools that need no parameters are routed locally. Each intent has:
+# - "phrases": n-grams that are strong evidence on their own (weight is the score if matched)
+# - "keywords": single words that add up as weaker evidence
+INTENT_RULES = {
+    "get_current_datetime": {
+        "phrases": {
+            "what time is it": 1.0, "what's the time": 1.0, "current time": 0.95,
+            "what's the date": 1.0, "what is the date": 1.0, "today's date": 1.0,
+            "what day is it": 1.0, "what time": 0.85, "what date": 0.85, "the time": 0.6,
+        },
+        "keywords": {"time": 0.35, "date": 0.4, "day": 0.15, "clock": 0.3, "today": 0.15},
+    },
+    "get_cpu_usage": {
+        "phrases": {
+            "cpu usage": 1.0, "cpu load": 1.0, "processor usage": 1.0, "processor load": 1.0,
+            "how busy is the cpu": 1.0, "cpu utilization": 1.0,
+        },
+        "keywords": {"cpu": 0.6, "processor": 0.5, "load": 0.2, "usage": 0.1},
+    },
+    "get_top_processes": {
+        "phrases": {
+            "top processes": 1.0, "which process": 0.9, "what process": 0.9, "which program": 0.85,
+            "hogging my cpu": 1.0, "hogging the cpu": 1.0, "eating my cpu": 1.0, "using the most cpu": 1.0,
+        },
+        "keywords": {"hogging": 0.6, "processes": 0.5, "process": 0.4, "programs": 0.3},
+    },
+    "get_memory_info": {
+        "phrases": {
+            "memory usage": 1.0, "ram usage": 1.0, "how much ram": 0.95, "how much memory": 0.95,
+            "free memory": 0.95, "memory info": 1.0,
+        },
+        "keywords": {"ram": 0.6, "memory": 0.5, "usage": 0.1},
+    },
+    "get_disk_usage": {
+        "phrases": {
+            "disk usage": 1.0, "disk space": 1.0, "free space": 0.9, "storage space": 0.95,
+            "how full is my disk": 1.0, "how full is the disk": 1.0,
+        },
+        "keywords": {"disk": 0.5, "drive": 0.35, "storage": 0.4, "space": 0.2},
+    },
+    "get_system_uptime": {
+        "phrases": {
+            "system uptime": 1.0, "how long has the pc been on": 1.0,
+            "how long has the computer been on": 1.0, "last boot": 0.95, "since boot": 0.9,
+        },
+        "keywords": {"uptime": 0.9, "boot": 0.4, "running": 0.1},
+    },
+    "list_safe_directory": {
+        "phrases": {
+            "list files": 0.95, "list the files": 0.95, "what files": 0.85, "safe zone": 0.7,
+            "designated folder": 0.8, "your folder": 0.6,
+        },
+        "keywords": {"files": 0.3, "folder": 0.25, "directory": 0.3, "list": 0.2},
+    },
+}
+
+# Words that suggest the user wants discussion/reasoning, not just a reading.
+# Each one found scales confidence down.
+COMPLEXITY_MARKERS = {
+    "why", "explain", "should", "would", "could", "if", "because", "compare", "remind",
+    "notify", "notification", "read", "open", "not", "don't", "never", "yesterday", "tomorrow",
+}
+COMPLEXITY_PENALTY = 0.5
+
+# Paths ("/home", "C:\Users", "./logs") and drive letters ("D:") also count as complexity markers:
+# the local route calls tools without parameters, so the LLM has to pick those requests up.
+# "drive d" names a drive without the colon.
+_PATH_MARKER_RE = re.compile(r"(?:^|\s)(?:[a-z]:(?=[\\/\s.,?!]|$)|[~.]{0,2}[\\/])|\bdrive [a-z]\b", re.IGNORECASE)
+
+# Words that carry no meaning of their own in a request for a reading ("how much ... is left").
+# Every other word must be covered by a matched phrase or keyword of the winning intent; the share
+# left uncovered ("what time is it *in tokyo*") is what the tool can't answer, so it lowers confidence.
+FILLER_WORDS = {
+    "a", "an", "the", "is", "are", "am", "was", "it", "it's", "its", "i", "i'm", "me", "my", "you",
+    "your", "we", "what", "what's", "whats", "how", "much", "many", "long", "which", "who", "do",
+    "does", "did", "can", "please", "tell", "show", "check", "give", "get", "of", "on", "in", "at",
+    "for", "to", "right", "now", "currently", "current", "there", "this", "that", "so", "far", "hey",
+    "using", "use", "used", "left", "remaining", "available", "have", "has", "been", "up", "all",
+}
+COVERAGE_EXPONENT = 2 # confidence *= coverage ** COVERAGE_EXPONENT
+
+# If two intents score within this margin of each other, the request is ambiguous.
+AMBIGUITY_MARGIN = 0.15
+
+_WORD_RE = re.compile(r"[a-z0-9']+")
+
+# Longest phrase in INTENT_RULES, in words: n-grams up to this length are generated
+MAX_PHRASE_WORDS = max(len(p.split()) for rule in INTENT_RULES.values() for p in rule["phrases"])
+
+
+# --- Classification ---
+def _normalize(text):
+    """Lowercases and tokenizes the input. Curly apostrophes are folded to plain ones."""
+    text = text.lower().replace("\u2019", "'")
+    return _WORD_RE.findall(text)
+
+
+def _ngrams(tokens, max_n=MAX_PHRASE_WORDS):
+    """Returns the set of all 1..max_n word n-grams (joined by spaces)."""
+    grams = set()
+    for n in range(1, max_n + 1):
+        for i in range(len(tokens) - n + 1):
+            grams.add(" ".join(tokens[i:i + n]))
+    return grams
+
+
+def _score_intent(rule, grams):
+    """Scores one intent: best matching phrase plus accumulated keyword evidence, capped at 1.0."""
+    phrase_score = max((w for p, w in rule["phrases"].items() if p in grams), default=0.0)
+    keyword_score = sum(w for k, w in rule["keywords"].items() if k in grams)
+    combined = phrase_score + 0.25 * keyword_score if phrase_score else keyword_score
+    return min(1.0, combined)
+
+
+def _coverage(rule, tokens, grams):
+    """
+    Share of the content words (everything but FILLER_WORDS) that the intent's matched phrases
+    and keywords account for. 1.0 if the request has no content words at all.
+    """
+    covered = set()
+    for phrase in rule["phrases"]:
+        if phrase in grams:
+            covered.update(phrase.split())
+    covered.update(k for k in rule["keywords"] if k in grams)
+    content = [t for t in tokens if t not in FILLER_WORDS]
+    if not content:
+        return 1.0
+    return sum(1 for t in content if t in covered) / len(content)
+
+
+def classify(text):
+    """
+    Classifies a user request.
+    Returns a dictionary:
+    {"tool_name": str or None, "confidence": float, "scores": dict, "latency_ms": float}
+    """
+    start = time.perf_counter()
+    tokens = _normalize(text)
+    grams = _ngrams(tokens)
+
+    scores = {name: _score_intent(rule, grams) for name, rule in INTENT_RULES.items()}
+    ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+    best_tool, best_score = ranked[0] if ranked else (None, 0.0)
+    runner_up_score = ranked[1][1] if len(ranked) > 1 else 0.0
+
+    confidence = best_score
+    # Words the tool can't account for ("in tokyo", "of easter", "does chrome use") change the question
+    coverage = _coverage(INTENT_RULES[best_tool], tokens, grams) if best_score > 0 else 0.0
+    confidence *= coverage ** COVERAGE_EXPONENT
+    # Penalize anything that looks more complex than a plain reading
+    complexity_hits = sum(1 for t in tokens if t in COMPLEXITY_MARKERS) + len(_PATH_MARKER_RE.findall(text))
+    confidence *= COMPLEXITY_PENALTY ** complexity_hits
+    if len(tokens) > MAX_TRIVIAL_WORDS:
+        confidence *= MAX_TRIVIAL_WORDS / len(tokens)
+    # Two competing intents means we're guessing
+    if best_score > 0 and best_score - runner_up_score < AMBIGUITY_MARGIN:
+        confidence *= 0.5
+
+    latency_ms = (time.perf_counter() - start) * 1000
+    return {
+        "tool_name": best_tool if best_score > 0 else None,
+        "confidence": round(confidence, 3),
+        "coverage": round(coverage, 3),
+        "scores": {k: round(v, 3) for k, v in scores.items() if v > 0},
+        "latency_ms": round(latency_ms, 3),
+    }
+
+
+def route(text, threshold=None):
+    """
+    Decides where a request should go.
+    Returns the classify() dictionary plus "route": "local" or "llm".
+    """
+    if threshold is None:
+        threshold = CONFIDENCE_THRESHOLD
+    decision = classify(text)
+    is_local = decision["tool_name"] is not None and decision["confidence"] >= threshold
+    decision["route"] = "local" if is_local else "llm"
+    decision["threshold"] = threshold
+    return decision
+
+
+# --- Local Replies ---
+SPOKEN_TOP_PROCESSES = 3 # Processes named when get_top_processes is answered aloud
+
+_PROCESS_LINE_RE = re.compile(r"\d+\. (.+?) \(PID \d+, user [^)]*\) - (?:CPU ([\d.]+)%|RAM ([\d.]+) MB)")
+
+
+def _speak_top_processes(result):
+    """Turns get_top_processes' result into a sentence: names and usage, no PIDs or timings."""
+    entries = []
+    for name, cpu, ram in _PROCESS_LINE_RE.findall(result):
+        if cpu and float(cpu) < 0.5:
+            continue # "0 percent" isn't worth saying
+        entries.append(f"{name} at {float(cpu):.0f} percent" if cpu else f"{name} with {float(ram):.0f} megabytes")
+    entries = entries[:SPOKEN_TOP_PROCESSES]
+    if not entries:
+        return "Nothing is using a noticeable amount of CPU right now."
+    if len(entries) == 1:
+        return f"The busiest process is {entries[0]}."
+    return f"The busiest processes are {', '.join(entries[:-1])} and {entries[-1]}."
+
+
+# Tools whose raw result isn't fit to be read aloud get a spoken rendering first
+SPOKEN_FORMATTERS = {
+    "get_top_processes": _speak_top_processes,
+}
+
+
+def render_reply(tool_name, tool_result_text, templates):
+    """Fills the personality template for a tool with its result. Falls back to the raw result."""
+    result = tool_result_text.strip()
+    if result.startswith("Result: "):
+        result = result[len("Result: "):]
+    if tool_name in SPOKEN_FORMATTERS:
+        result = SPOKEN_FORMATTERS[tool_name](result)
+    template = templates.get(tool_name) or templates.get("default") or "{result}"
+    return template.format(result=result)
+
+
+# --- Logging ---
+def log_decision(user_input, decision, handled_locally=False, total_ms=None, note=None):
+    """Records a route decision and its latency for threshold tuning."""
+    entry = {
+        "timestamp": time.time(),
+        "input": user_input,
+        "route": decision.get("route"),
+        "handled_locally": handled_locally,
+        "tool_name": decision.get("tool_name"),
+        "confidence": decision.get("confidence"),
+        "threshold": decision.get("threshold"),
+        "classify_ms": decision.get("latency_ms"),
+        "total_ms": round(total_ms, 3) if total_ms is not None else None,
+        "scores": decision.get("scores"),
+    }
+    if note:
+        entry["note"] = note
+
+    if ROUTER_VERBOSE:
+        total_str = f", total {entry['total_ms']} ms" if entry["total_ms"] is not None else ""
+        print(f"[Router] {entry['route']} -> {entry['tool_name']} "
+              f"(confidence {entry['confidence']}, classify {entry['classify_ms']} ms{total_str})")
+
+    if ROUTER_LOG_FILE:
+        try:
+            with open(ROUTER_LOG_FILE, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry) + "\n")
+        except OSError as e:
+            print(f"Warning: Could not write router log '{ROUTER_LOG_FILE}': {e}")
+
+
+# --- Benchmark / Self-test ---
+# Usage: python intent_router.py [benchmark.tsv]
+# Each benchmark line is "<expected_tool or llm>\t<utterance>".
+SAMPLE_BENCHMARK = [
+    ("get_current_datetime", "what's the date"),
+    ("get_current_datetime", "What time is it?"),
+    ("get_cpu_usage", "cpu usage"),
+    ("get_top_processes", "what's hogging my cpu"),
+    ("get_memory_info", "how much ram am I using"),
+    ("get_disk_usage", "how much disk space is left"),
+    ("get_system_uptime", "what's the uptime"),
+    ("get_system_uptime", "how long has the computer been on"),
+    ("list_safe_directory", "list files in the safe zone"),
+    ("llm", "why is my cpu usage so high and should I worry"),
+    ("llm", "remind me about the meeting at 5"),
+    ("llm", "read test.txt"),
+    ("llm", "disk usage of /home"),
+    ("llm", "how much disk space do I have on D:"),
+    ("llm", "list files in C:\\Users"),
+    ("llm", "tell me a joke about cake"),
+    ("llm", "what time is it in Tokyo"),
+    ("llm", "what time does the store close"),
+    ("llm", "what is the date of easter next year"),
+    ("llm", "how much memory does chrome use"),
+    ("llm", "how much free space is on drive d"),
+]
+
+
+def _evaluate(samples, thresholds=(0.5, 0.6, 0.7, 0.75, 0.8, 0.9)):
+    """Prints routing accuracy and false-local rate per threshold."""
+    decisions = [(expected, text, classify(text)) for expected, text in samples]
+    for threshold in thresholds:
+        correct = false_local = 0
+        for expected, _, d in decisions:
+            predicted = d["tool_name"] if d["tool_name"] and d["confidence"] >= threshold else "llm"
+            correct += predicted == expected
+            false_local += predicted != "llm" and predicted != expected
+        print(f"threshold {threshold:.2f}: accuracy {correct}/{len(samples)}, wrong local answers {false_local}")
+    avg_ms = sum(d["latency_ms"] for _, _, d in decisions) / max(len(decisions), 1)
+    print(f"Average classify latency: {avg_ms:.3f} ms")
+
+
+if __name__ == '__main__':
+    import sys
+    samples = SAMPLE_BENCHMARK
+    if len(sys.argv) > 1:
+        with open(sys.argv[1], encoding="utf-8") as f:
+            samples = [tuple(line.rstrip("\n").split("\t", 1)) for line in f if "\t" in line]
+    _evaluate(samples)
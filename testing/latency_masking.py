@@ -0,0 +1,273 @@
+# latency_masking.py
+# Filler audio while waiting on the LLM.
+# A small bank of short, personality-specific lines ("Hmm.", "Processing...") is pre-rendered
+# at startup. If nothing has been audible for FILLER_DELAY seconds while a reply is pending,
+# one of them plays. The moment real speech reaches the playback engine, the filler fades out
+# and the speech follows it directly (see PlaybackEngine.claim()).
+# Stats report how much of the waiting silence ("dead air") the fillers covered.
+
+import random
+import threading
+import time
+from array import array
+from contextlib import contextmanager
+
+import audio_playback
+
+# --- Configuration ---
+FILLER_DELAY = 0.8 # Seconds of silence during a wait before the first filler plays
+FILLER_GAP = 3.0 # Seconds of silence before another filler in the same wait
+MAX_FILLERS_PER_WAIT = 2 # More than this starts to sound like stalling
+FEED_AHEAD_MS = 120 # Filler audio queued ahead in the engine. Bounds how late a handoff can be
+FADE_MS = 30 # Fade-out when real speech takes over, so the cut doesn't click
+POLL_INTERVAL = 0.02 # Seconds
+PREEMPT_TIMEOUT = 0.25 # Longest the real speech waits for the filler to wrap up
+
+
+def _fade_out(pcm):
+    """Applies a linear fade to zero over int16 PCM bytes."""
+    samples = array("h")
+    samples.frombytes(pcm)
+    n = len(samples)
+    for i in range(n):
+        samples[i] = int(samples[i] * (n - i) / n)
+    return samples.tobytes()
+
+
+class FillerBank:
+    """Pre-rendered filler clips. Rendering runs in the background; clips become usable as they finish."""
+
+    def __init__(self, lines, render_fn):
+        self.lines = list(lines or [])
+        self.render_fn = render_fn # text -> (pcm_bytes, sample_rate) or None
+        self.clips = [] # (text, pcm_bytes, sample_rate)
+        self._last = None
+        self._lock = threading.Lock()
+
+    def prerender(self, background=True):
+        """Renders every line. Returns immediately if background is True."""
+        if background:
+            threading.Thread(target=self._render_all, name="FillerPrerender", daemon=True).start()
+        else:
+            self._render_all()
+
+    def _render_all(self):
+        start = time.perf_counter()
+        for line in self.lines:
+            try:
+                rendered = self.render_fn(line)
+            except Exception as e:
+                print(f"Warning: Could not pre-render filler '{line}': {e}")
+                continue
+            if rendered and rendered[0]:
+                with self._lock:
+                    self.clips.append((line, rendered[0], rendered[1]))
+        print(f"Pre-rendered {len(self.clips)}/{len(self.lines)} filler clip(s) in {time.perf_counter() - start:.1f}s.")
+
+    def pick(self):
+        """Returns a random clip, avoiding the one played last. None if nothing is ready."""
+        with self._lock:
+            choices = [c for c in self.clips if c[0] != self._last] or self.clips
+            if not choices:
+                return None
+            clip = random.choice(choices)
+            self._last = clip[0]
+            return clip
+
+
+class LatencyMasker:
+    """
+    Covers waits with filler clips. Wrap each LLM call in cover():
+        with masker.cover():
+            reply = get_llm_response(...)
+    busy_fn() tells whether other speech is queued or playing (silence is only measured without it).
+    """
+
+    def __init__(self, bank, busy_fn=None):
+        self.bank = bank
+        self.busy_fn = busy_fn or (lambda: False)
+        self._lock = threading.Lock()
+        self._covering = False
+        self._thread = None
+        self._preempt = threading.Event()
+        self._filler_done = threading.Event()
+        self._filler_done.set()
+
+        # Stats
+        self.waits = 0
+        self.waits_masked = 0
+        self.fillers_played = 0
+        self.fillers_preempted = 0 # Faded out because the real reply was ready
+        self.masked_seconds = 0.0 # Filler audio that played while waiting
+        self.unmasked_seconds = 0.0 # Silence during waits that no filler covered
+
+    # --- Waits ---
+    @contextmanager
+    def cover(self):
+        self.start_wait()
+        try:
+            yield
+        finally:
+            self.end_wait()
+
+    def start_wait(self):
+        with self._lock:
+            self.waits += 1
+            self._covering = True
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._watch, name="LatencyMasker", daemon=True)
+                self._thread.start()
+
+    def end_wait(self):
+        """The reply is here. No new fillers start; one already playing runs until real speech preempts it."""
+        with self._lock:
+            self._covering = False
+
+    # --- Worker ---
+    def _watch(self):
+        silence = 0.0
+        fillers_this_wait = 0
+        was_covering = False
+        filler = None # [engine, generation, pcm, offset, sample_rate]
+        last = time.perf_counter()
+        while True:
+            time.sleep(POLL_INTERVAL)
+            now = time.perf_counter()
+            dt, last = now - last, now
+            with self._lock:
+                covering = self._covering
+            if covering and not was_covering:
+                silence, fillers_this_wait = 0.0, 0 # A new wait began
+            was_covering = covering
+
+            if filler:
+                if self._feed(filler):
+                    continue
+                filler = None
+                silence = 0.0
+            if not covering:
+                return
+
+            if self.busy_fn():
+                silence = 0.0
+                continue
+            silence += dt
+            self.unmasked_seconds += dt
+            needed = FILLER_DELAY if fillers_this_wait == 0 else FILLER_GAP
+            if silence >= needed and fillers_this_wait < MAX_FILLERS_PER_WAIT:
+                clip = self.bank.pick()
+                if clip:
+                    filler = self._start_filler(clip)
+                    fillers_this_wait += 1
+                    if fillers_this_wait == 1:
+                        self.waits_masked += 1
+
+    def _start_filler(self, clip):
+        text, pcm, sample_rate = clip
+        engine = audio_playback.get_engine(sample_rate)
+        self._preempt.clear()
+        self._filler_done.clear()
+        engine.claim(self, self._on_preempt)
+        self.fillers_played += 1
+        print(f"[Filler] {text}")
+        return [engine, engine.generation, pcm, 0, sample_rate]
+
+    def _feed(self, filler):
+        """Feeds the next piece of the filler. Returns False once the filler is finished."""
+        engine, generation, pcm, offset, sample_rate = filler
+        bytes_per_second = sample_rate * audio_playback.SAMPLE_WIDTH
+        if engine.generation != generation: # Barge-in (stop_speaking) already flushed it
+            return self._finish_filler(engine, end=False)
+        if self._preempt.is_set():
+            fade_bytes = int(sample_rate * FADE_MS / 1000) * audio_playback.SAMPLE_WIDTH
+            tail = pcm[offset:offset + fade_bytes]
+            if tail:
+                engine.enqueue(_fade_out(tail), owner=self)
+                self.masked_seconds += len(tail) / bytes_per_second
+            self.fillers_preempted += 1
+            return self._finish_filler(engine)
+        if offset >= len(pcm):
+            return self._finish_filler(engine)
+        if engine.queue_depth_ms() < FEED_AHEAD_MS:
+            piece = pcm[offset:offset + int(bytes_per_second * FEED_AHEAD_MS / 1000) // 2 * 2]
+            engine.enqueue(piece, owner=self)
+            filler[3] = offset + len(piece)
+            self.masked_seconds += len(piece) / bytes_per_second
+        return True
+
+    def _finish_filler(self, engine, end=True):
+        engine.release(self)
+        if end:
+            engine.end_stream()
+        self._filler_done.set()
+        return False
+
+    def _on_preempt(self):
+        """Called by the engine on the thread queuing real speech, right before that audio is queued."""
+        self._preempt.set()
+        self._filler_done.wait(timeout=PREEMPT_TIMEOUT)
+
+    # --- Stats ---
+    def stats(self):
+        total = self.masked_seconds + self.unmasked_seconds
+        return {
+            "waits": self.waits,
+            "waits_masked": self.waits_masked,
+            "fillers_played": self.fillers_played,
+            "fillers_preempted": self.fillers_preempted,
+            "masked_seconds": round(self.masked_seconds, 2),
+            "unmasked_seconds": round(self.unmasked_seconds, 2),
+            "masked_ratio": round(self.masked_seconds / total, 3) if total else None,
+        }
+
+    def format_stats(self):
+        s = self.stats()
+        ratio = f"{s['masked_ratio']:.0%}" if s["masked_ratio"] is not None else "n/a"
+        return (f"Latency masking: {s['fillers_played']} filler(s) over {s['waits_masked']}/{s['waits']} wait(s), "
+                f"{s['masked_seconds']}s of dead air masked, {s['unmasked_seconds']}s unmasked ({ratio} masked), "
+                f"{s['fillers_preempted']} faded out for the reply")
+
+
+def create_masker(tts, lines):
+    """
+    Builds a masker for a tts_backends backend and starts pre-rendering its filler lines.
+    Fillers only play if the backend can pre-render clips (Piper with the playback engine);
+    otherwise the bank stays empty and waits are just measured.
+    """
+    if not lines or not hasattr(tts, "render_clip"):
+        return None
+    bank = FillerBank(lines, tts.render_clip)
+    bank.prerender()
+    return LatencyMasker(bank, busy_fn=tts.is_speaking)
+
+
+# --- Self-test (runs headless with tones instead of speech) ---
+if __name__ == '__main__':
+    import math
+    import struct
+
+    RATE = 22050
+
+    def _tone(text, seconds=1.0):
+        freq = 300 + 40 * len(text)
+        pcm = b"".join(struct.pack("<h", int(8000 * math.sin(2 * math.pi * freq * i / RATE)))
+                       for i in range(int(RATE * seconds)))
+        return pcm, RATE
+
+    audio_playback._default_engine = audio_playback.PlaybackEngine(
+        sink=audio_playback.NullSink(realtime=True), sample_rate=RATE)
+    engine = audio_playback.get_engine(RATE)
+    bank = FillerBank(["Hmm.", "One moment."], _tone)
+    bank.prerender(background=False)
+    masker = LatencyMasker(bank, busy_fn=lambda: False)
+
+    for wait_seconds in (0.3, 1.4, 6.0):
+        with masker.cover():
+            time.sleep(wait_seconds) # Pretend the LLM is thinking
+        start = time.perf_counter()
+        engine.play(_tone("reply", 0.3)[0]) # Real speech arrives and preempts any filler
+        print(f"Wait {wait_seconds}s: reply queued after {(time.perf_counter() - start) * 1000:.1f} ms")
+        engine.wait()
+    print(masker.format_stats())
+    print("Playback:", engine.stats())
+    engine.close()
@@ -0,0 +1,257 @@
+# llm_hedging.py
+# Hedged LLM requests to cut tail latency.
+# If the first request hasn't produced its first token within an adaptive threshold
+# (the observed p90 time-to-first-token), a second request is sent to the same or an alternate
+# model. Whichever starts answering first wins; the other one is cancelled.
+# Hedges are limited per call type so the extra cost stays bounded.
+
+import threading
+import time
+from collections import deque
+
+import llm_providers
+
+# --- Configuration ---
+# Percentile of recent time-to-first-token used as the hedge trigger.
+HEDGE_PERCENTILE = 0.9
+# Until this many samples exist, DEFAULT_THRESHOLD is used.
+MIN_SAMPLES = 10
+DEFAULT_THRESHOLD = 2.5 # Seconds
+# The adaptive threshold is clamped to this range (seconds).
+THRESHOLD_BOUNDS = (0.5, 10.0)
+SAMPLE_WINDOW = 200 # Recent time-to-first-token samples kept
+
+# Maximum fraction of calls of each type that may send a hedge request.
+HEDGE_BUDGETS = {
+    "chat": 0.15,
+    "commentary": 0.10,
+}
+DEFAULT_HEDGE_BUDGET = 0.10
+# Hedges allowed on top of the budget, so a slow first call of the session can still be hedged.
+HEDGE_BURST = 1
+
+# Overall limit for one hedged call (seconds), matching the normal request timeout.
+CALL_TIMEOUT = 45
+
+
+class _Attempt:
+    """One request in flight: its events, outcome and cancel switch."""
+
+    def __init__(self, label, model):
+        self.label = label
+        self.model = model
+        self.started = time.perf_counter()
+        self.first_token = threading.Event()
+        self.done = threading.Event()
+        self.cancel = llm_providers.CancelToken() # Closes the connection too, even before headers arrive
+        self.result = None
+        self.timing = None
+        self.error = None
+
+    @property
+    def succeeded(self):
+        return self.done.is_set() and self.error is None
+
+
+class HedgedRequester:
+    """Wraps an llm_providers.LLMProvider with hedging. Same return contract as chat_completion()."""
+
+    def __init__(self, provider, alternate_model=None, alternate_provider=None):
+        self.provider = provider
+        self.alternate_provider = alternate_provider or provider
+        self.alternate_model = alternate_model # None = same model as the primary
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._ttft_samples = deque(maxlen=SAMPLE_WINDOW)
+        self._stats = {}
+
+    # --- Threshold / Budget ---
+    def threshold(self):
+        """Current hedge trigger in seconds: the observed p90 time-to-first-token, clamped."""
+        with self._lock:
+            samples = sorted(self._ttft_samples)
+        if len(samples) < MIN_SAMPLES:
+            return DEFAULT_THRESHOLD
+        value = samples[min(len(samples) - 1, int(len(samples) * HEDGE_PERCENTILE))]
+        low, high = THRESHOLD_BOUNDS
+        return max(low, min(high, value))
+
+    def _call_stats(self, call_type):
+        return self._stats.setdefault(call_type, {"calls": 0, "hedges_fired": 0, "hedge_wins": 0,
+                                                   "skipped_budget": 0})
+
+    def _may_hedge(self, call_type):
+        stats = self._call_stats(call_type)
+        budget = HEDGE_BUDGETS.get(call_type, DEFAULT_HEDGE_BUDGET)
+        return stats["hedges_fired"] < budget * stats["calls"] + HEDGE_BURST
+
+    def stats(self):
+        """Per call type: calls, hedges fired, hedges that won, hedges skipped for budget."""
+        with self._lock:
+            result = {k: dict(v) for k, v in self._stats.items()}
+        for v in result.values():
+            v["fire_rate"] = round(v["hedges_fired"] / v["calls"], 3) if v["calls"] else 0.0
+            v["win_rate"] = round(v["hedge_wins"] / v["hedges_fired"], 3) if v["hedges_fired"] else 0.0
+        return {"threshold_seconds": round(self.threshold(), 3), "by_call_type": result}
+
+    def format_stats(self):
+        s = self.stats()
+        lines = [f"LLM hedging (threshold {s['threshold_seconds']}s):"]
+        for call_type, v in s["by_call_type"].items():
+            lines.append(f"  {call_type}: {v['calls']} call(s), {v['hedges_fired']} hedge(s) fired "
+                         f"({v['fire_rate']:.0%}), {v['hedge_wins']} won ({v['win_rate']:.0%}), "
+                         f"{v['skipped_budget']} skipped by budget")
+        return "\n".join(lines)
+
+    # --- Requests ---
+    def _launch(self, attempt, provider, messages, kwargs):
+        def on_first_token():
+            with self._changed:
+                attempt.first_token.set()
+                self._changed.notify_all()
+
+        def run():
+            try:
+                attempt.result, attempt.timing = provider.chat_completion(
+                    messages, model=attempt.model, on_first_token=on_first_token,
+                    cancel_event=attempt.cancel, **kwargs)
+            except Exception as e:
+                attempt.error = e
+            with self._changed:
+                attempt.done.set()
+                self._changed.notify_all()
+
+        threading.Thread(target=run, name=f"LLM-{attempt.label}", daemon=True).start()
+
+    def chat_completion(self, messages, call_type="chat", **kwargs):
+        """
+        Like LLMProvider.chat_completion(), hedged. kwargs are passed through (force_text_only,
+        max_tokens, stream, timeout). Streaming should be on, otherwise "first token" means "done".
+        Raises the primary request's error if every attempt fails.
+        """
+        with self._lock:
+            self._call_stats(call_type)["calls"] += 1
+        start = time.perf_counter()
+        deadline = start + CALL_TIMEOUT
+        primary = _Attempt("primary", None)
+        attempts = [primary]
+        self._launch(primary, self.provider, messages, kwargs)
+
+        # Phase 1: give the primary until the threshold to start answering
+        trigger_at = start + self.threshold()
+        with self._changed:
+            while not (primary.first_token.is_set() or primary.done.is_set()):
+                remaining = trigger_at - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self._changed.wait(timeout=remaining)
+            needs_hedge = not (primary.first_token.is_set() or primary.done.is_set())
+            if needs_hedge:
+                if self._may_hedge(call_type):
+                    self._call_stats(call_type)["hedges_fired"] += 1
+                else:
+                    self._call_stats(call_type)["skipped_budget"] += 1
+                    needs_hedge = False
+
+        if needs_hedge:
+            hedge = _Attempt("hedge", self.alternate_model)
+            attempts.append(hedge)
+            print(f"[Hedge] No first token after {time.perf_counter() - start:.2f}s, "
+                  f"sending hedge request{f' to {self.alternate_model}' if self.alternate_model else ''}.")
+            self._launch(hedge, self.alternate_provider, messages, kwargs)
+
+        # Phase 2: the first attempt to start answering (or finish successfully) wins
+        winner = None
+        with self._changed:
+            while winner is None:
+                for attempt in attempts:
+                    if (attempt.first_token.is_set() and attempt.error is None) or attempt.succeeded:
+                        winner = attempt
+                        break
+                if winner or all(a.done.is_set() for a in attempts):
+                    break
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self._changed.wait(timeout=remaining)
+
+        for attempt in attempts:
+            if attempt is not winner:
+                attempt.cancel.set()
+
+        if winner is None:
+            primary.cancel.set()
+            if primary.error is not None:
+                raise primary.error
+            for attempt in attempts:
+                if attempt.error is not None:
+                    raise attempt.error
+            raise llm_providers.requests.exceptions.Timeout("Hedged request timed out.")
+
+        # Phase 3: let the winner finish streaming
+        winner.done.wait(timeout=max(0.0, deadline - time.perf_counter()))
+        if not winner.done.is_set():
+            winner.cancel.set()
+            raise llm_providers.requests.exceptions.Timeout("Hedged request timed out while streaming.")
+        if winner.error is not None:
+            raise winner.error
+
+        with self._lock:
+            if winner is not primary:
+                self._call_stats(call_type)["hedge_wins"] += 1
+            ttft = winner.timing.get("first_token") if winner.timing else None
+            if ttft is None and winner.timing:
+                ttft = winner.timing.get("elapsed")
+            if ttft is not None:
+                # Measured from the start of the whole call, so a slow primary raises the percentile
+                offset = winner.started - start
+                self._ttft_samples.append(ttft + offset)
+
+        timing = dict(winner.timing or {})
+        timing["hedged"] = len(attempts) > 1
+        timing["winner"] = winner.label
+        return winner.result, timing
+
+
+# --- Self-test against a local stub server (first request stalls, the hedge answers) ---
+if __name__ == '__main__':
+    import json
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    _request_count = [0]
+
+    class _StubHandler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            _request_count[0] += 1
+            stall = 3.0 if _request_count[0] == 2 else 0.05 # Second call's primary stalls
+            time.sleep(stall)
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.end_headers()
+            try:
+                for piece in ("Hello", " there."):
+                    chunk = {"choices": [{"delta": {"content": piece}, "finish_reason": None}]}
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                    self.wfile.flush()
+                    time.sleep(0.05)
+                final = {"choices": [{"delta": {}, "finish_reason": "stop"}]}
+                self.wfile.write(f"data: {json.dumps(final)}\n\ndata: [DONE]\n\n".encode())
+            except OSError:
+                pass # Client hung up (cancelled loser)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    DEFAULT_THRESHOLD = 0.5
+    hedger = HedgedRequester(llm_providers.local_provider(base_url=f"http://127.0.0.1:{server.server_port}/v1"))
+    messages = [{"role": "user", "content": "hi"}]
+    for _ in range(3):
+        start = time.perf_counter()
+        result, timing = hedger.chat_completion(messages, call_type="chat", stream=True, timeout=10)
+        print(f"{result['choices'][0]['message']['content']!r} in {time.perf_counter() - start:.2f}s "
+              f"(winner={timing['winner']}, hedged={timing['hedged']})")
+    print(hedger.format_stats())
+    server.shutdown()
@@ -0,0 +1,341 @@
+# llm_providers.py
+# Provider abstraction for OpenAI-compatible chat completion endpoints.
+# OpenRouter and a localhost server (llama.cpp / Ollama / vLLM style) share one code path;
+# per-provider capability flags decide which request fields are sent, and streamed replies
+# are reassembled into the normal non-streaming response shape so callers parse them the same way.
+
+import json
+import socket
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# --- Configuration ---
+OPENROUTER_BASE_URL = "https://openrouter.ai/api/v1"
+LOCAL_BASE_URL = "http://localhost:8080/v1" # llama.cpp server default. Ollama: http://localhost:11434/v1
+LOCAL_MODEL = "local-model" # Most local servers ignore this or use it to pick a loaded model
+
+DEFAULT_CAPABILITIES = {
+    "native_tools": False, # Server returns structured tool_calls. If False they're ignored; tools come as JSON in the text
+    "tool_choice": False, # Server accepts the tool_choice field
+    "caching": False, # Server reports cached prompt tokens. If False, cached counts are ignored in token accounting
+    "usage_include": False, # OpenRouter-style {"usage": {"include": true}}
+    "streaming": True, # Server supports "stream": true (SSE)
+    "stream_usage": False, # Server accepts stream_options.include_usage
+}
+
+
+class RequestCancelled(Exception):
+    """Raised when a request is cancelled through its cancel_event."""
+    pass
+
+
+class CancelToken:
+    """
+    A threading.Event-like cancel flag that also runs callbacks when set.
+    chat_completion() registers one that closes the request's socket, so cancelling works even
+    while the server hasn't sent response headers yet (a plain Event is only checked between
+    streamed lines).
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    def is_set(self):
+        return self._event.is_set()
+
+    def wait(self, timeout=None):
+        return self._event.wait(timeout)
+
+    def set(self):
+        with self._lock:
+            if self._event.is_set():
+                return
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                print(f"Warning: Cancel callback failed: {e}")
+
+    def add_callback(self, callback):
+        """Runs callback on set(), or right away if already set."""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+
+
+class _AbortableAdapter(HTTPAdapter):
+    """HTTPAdapter that remembers the sockets it opens, so abort() can tear them down from another thread."""
+
+    def __init__(self):
+        self._sockets = []
+        self._lock = threading.Lock()
+        self._aborted = False
+        super().__init__()
+
+    def get_connection_with_tls_context(self, *args, **kwargs):
+        pool = super().get_connection_with_tls_context(*args, **kwargs)
+        base = pool.ConnectionCls
+        if not getattr(base, "_abortable", False):
+            adapter = self
+
+            class TrackedConnection(base):
+                _abortable = True
+
+                def connect(self):
+                    super().connect()
+                    adapter._track(self.sock)
+
+            pool.ConnectionCls = TrackedConnection
+        return pool
+
+    def _track(self, sock):
+        with self._lock:
+            self._sockets.append(sock)
+            aborted = self._aborted
+        if aborted:
+            self._close(sock)
+
+    def abort(self):
+        with self._lock:
+            self._aborted = True
+            sockets = list(self._sockets)
+        for sock in sockets:
+            self._close(sock)
+
+    @staticmethod
+    def _close(sock):
+        try:
+            sock.shutdown(socket.SHUT_RDWR) # Wakes up a thread blocked in recv()
+        except OSError:
+            pass
+        try:
+            sock.close()
+        except OSError:
+            pass
+
+
+class LLMProvider:
+    """An OpenAI-compatible /chat/completions endpoint."""
+
+    def __init__(self, name, base_url, model, api_key=None, extra_headers=None,
+                 capabilities=None, requires_key=False):
+        self.name = name
+        self.base_url = base_url.rstrip("/")
+        self.model = model
+        self.api_key = api_key
+        self.extra_headers = extra_headers or {}
+        self.capabilities = dict(DEFAULT_CAPABILITIES, **(capabilities or {}))
+        self.requires_key = requires_key
+
+    def supports(self, capability):
+        return bool(self.capabilities.get(capability))
+
+    @property
+    def endpoint(self):
+        return f"{self.base_url}/chat/completions"
+
+    def credentials_error(self):
+        """Returns an error string if the provider can't be used without a (valid) key."""
+        if self.requires_key and (not self.api_key or self.api_key.endswith("...") or self.api_key.endswith("xxx")):
+            return f"API key for provider '{self.name}' is missing or a placeholder."
+        return None
+
+    def headers(self):
+        headers = {"Content-Type": "application/json"}
+        if self.api_key:
+            headers["Authorization"] = f"Bearer {self.api_key}"
+        headers.update(self.extra_headers)
+        return headers
+
+    def build_payload(self, messages, force_text_only=False, max_tokens=None, stream=False, model=None):
+        """Builds the request body, leaving out fields the provider doesn't understand."""
+        data = {"model": model or self.model, "messages": messages}
+        if self.supports("tool_choice"):
+            data["tool_choice"] = "none" if force_text_only else "auto"
+        if max_tokens:
+            data["max_tokens"] = max_tokens
+        if self.supports("usage_include"):
+            data["usage"] = {"include": True}
+        if stream:
+            data["stream"] = True
+            if self.supports("stream_usage"):
+                data["stream_options"] = {"include_usage": True}
+        return data
+
+    def chat_completion(self, messages, force_text_only=False, max_tokens=None, stream=False,
+                        timeout=45, model=None, on_first_token=None, cancel_event=None):
+        """
+        Sends one chat completion request.
+        Returns (result, timing): result is always in non-streaming response format
+        ({"choices": [{"message": {...}, "finish_reason": ...}], "usage": ...});
+        timing has "elapsed" and, when streaming, "first_token" (seconds).
+        Raises requests exceptions on network/HTTP errors and RequestCancelled if cancelled.
+        With a CancelToken as cancel_event, cancelling closes the connection at once, at any stage.
+        """
+        stream = stream and self.supports("streaming")
+        payload = self.build_payload(messages, force_text_only, max_tokens, stream, model)
+        start = time.perf_counter()
+        if not hasattr(cancel_event, "add_callback"):
+            response = requests.post(self.endpoint, headers=self.headers(), json=payload,
+                                     timeout=timeout, stream=stream)
+            try:
+                return self._read_response(response, stream, start, on_first_token, cancel_event)
+            finally:
+                response.close()
+
+        # Own session and adapter, so cancelling tears down only this request's socket
+        adapter = _AbortableAdapter()
+        session = requests.Session()
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        cancel_event.add_callback(adapter.abort)
+        try:
+            response = session.post(self.endpoint, headers=self.headers(), json=payload,
+                                    timeout=timeout, stream=stream)
+            try:
+                return self._read_response(response, stream, start, on_first_token, cancel_event)
+            finally:
+                response.close()
+        except (requests.exceptions.RequestException, OSError, ValueError):
+            if cancel_event.is_set():
+                raise RequestCancelled(f"Request to '{self.name}' cancelled.")
+            raise
+        finally:
+            session.close()
+
+    def _read_response(self, response, stream, start, on_first_token, cancel_event):
+        response.raise_for_status()
+        if not stream:
+            return response.json(), {"elapsed": time.perf_counter() - start, "first_token": None}
+        return self._read_stream(response, start, on_first_token, cancel_event)
+
+    def _read_stream(self, response, start, on_first_token=None, cancel_event=None):
+        """Reassembles an SSE stream of chat.completion.chunk events into one response."""
+        content_parts = []
+        tool_calls = {} # index -> {"id", "type", "function": {"name", "arguments"}}
+        finish_reason = None
+        usage = None
+        first_token = None
+
+        for raw_line in response.iter_lines():
+            if cancel_event is not None and cancel_event.is_set():
+                raise RequestCancelled(f"Request to '{self.name}' cancelled.")
+            if not raw_line:
+                continue
+            line = raw_line.decode("utf-8", errors="ignore") if isinstance(raw_line, bytes) else raw_line
+            if line.startswith(":") or not line.startswith("data:"):
+                continue # SSE comment (OpenRouter keep-alive) or unrelated field
+            body = line[len("data:"):].strip()
+            if body == "[DONE]":
+                break
+            try:
+                chunk = json.loads(body)
+            except json.JSONDecodeError:
+                continue
+            if chunk.get("error"):
+                raise requests.exceptions.RequestException(f"Stream error: {chunk['error']}")
+            if chunk.get("usage"):
+                usage = chunk["usage"]
+            for choice in chunk.get("choices") or []:
+                delta = choice.get("delta") or {}
+                if delta.get("content"):
+                    content_parts.append(delta["content"])
+                for tc in delta.get("tool_calls") or []:
+                    entry = tool_calls.setdefault(tc.get("index", 0), {"id": None, "type": "function", "function": {"name": "", "arguments": ""}})
+                    if tc.get("id"):
+                        entry["id"] = tc["id"]
+                    fn = tc.get("function") or {}
+                    if fn.get("name"):
+                        entry["function"]["name"] += fn["name"]
+                    if fn.get("arguments"):
+                        entry["function"]["arguments"] += fn["arguments"]
+                if (delta.get("content") or delta.get("tool_calls")) and first_token is None:
+                    first_token = time.perf_counter() - start
+                    if on_first_token:
+                        on_first_token()
+                if choice.get("finish_reason"):
+                    finish_reason = choice["finish_reason"]
+
+        message = {"role": "assistant", "content": "".join(content_parts) or None}
+        if tool_calls:
+            message["tool_calls"] = [tool_calls[i] for i in sorted(tool_calls)]
+        result = {"choices": [{"message": message, "finish_reason": finish_reason}]}
+        if usage:
+            result["usage"] = usage
+        return result, {"elapsed": time.perf_counter() - start, "first_token": first_token}
+
+
+# --- Factories ---
+def openrouter_provider(api_key, model, site_url=None, app_name=None):
+    """OpenRouter: native tools, tool_choice, cached-token usage reporting, streaming."""
+    extra_headers = {}
+    if site_url:
+        extra_headers["HTTP-Referer"] = site_url
+    if app_name:
+        extra_headers["X-Title"] = app_name
+    return LLMProvider("openrouter", OPENROUTER_BASE_URL, model, api_key=api_key,
+                       extra_headers=extra_headers, requires_key=True,
+                       capabilities={"native_tools": True, "tool_choice": True, "caching": True,
+                                     "usage_include": True, "streaming": True, "stream_usage": False})
+
+
+def local_provider(base_url=None, model=None, api_key=None, capabilities=None):
+    """
+    A localhost OpenAI-compatible server. Tool calls are expected as the custom JSON in the reply
+    text (see the system prompt), so no native tool support is assumed unless enabled.
+    """
+    caps = {"stream_usage": True}
+    caps.update(capabilities or {})
+    return LLMProvider("local", base_url or LOCAL_BASE_URL, model or LOCAL_MODEL,
+                       api_key=api_key, capabilities=caps)
+
+
+# --- Self-test against a local stub server ---
+if __name__ == '__main__':
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+
+    class _StubHandler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            reply = '{"tool_name": "get_cpu_usage", "parameters": {}}'
+            if body.get("stream"):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.end_headers()
+                for piece in (reply[:10], reply[10:]):
+                    chunk = {"choices": [{"delta": {"content": piece}, "finish_reason": None}]}
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                final = {"choices": [{"delta": {}, "finish_reason": "stop"}],
+                         "usage": {"prompt_tokens": 12, "completion_tokens": 9}}
+                self.wfile.write(f"data: {json.dumps(final)}\n\ndata: [DONE]\n\n".encode())
+            else:
+                result = {"choices": [{"message": {"role": "assistant", "content": reply}, "finish_reason": "stop"}],
+                          "usage": {"prompt_tokens": 12, "completion_tokens": 9}}
+                payload = json.dumps(result).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+    server = HTTPServer(("127.0.0.1", 0), _StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    provider = local_provider(base_url=f"http://127.0.0.1:{server.server_port}/v1")
+    messages = [{"role": "user", "content": "cpu?"}]
+    for use_stream in (False, True):
+        result, timing = provider.chat_completion(messages, stream=use_stream, max_tokens=50)
+        print(f"stream={use_stream}: {result['choices'][0]['message']['content']!r} "
+              f"usage={result.get('usage')} timing={timing}")
+    server.shutdown()
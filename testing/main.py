@@ -3,10 +3,12 @@
 
 import requests
 import json
+import llm_providers
+import llm_hedging
 # import os # Removed, no longer needed for key import
 # import sys # Removed, no longer needed for key import
 import time # Added for potential error delay
-import shutil # Added for piper check
+import threading
 import re # Import regex module
 from collections import deque
 import personality_cores
@@ -24,15 +26,22 @@ except ImportError:
     # OPENROUTER_API_KEY remains None, subsequent checks will handle this
 
 # --- Local Imports (relative to this script's location) ---
+# TTS goes through a backend interface: Piper if configured, else pyttsx3, else console only.
+# Preference order is set in tts_backends.py (BACKEND_PREFERENCE).
 try:
-    from tts_piper import speak
-    TTS_ENABLED = True
+    import tts_backends
+    tts = tts_backends.select_backend()
+    TTS_ENABLED = tts.active_name != "print"
+    speak = tts.speak
+    stop_speaking = tts.stop # Barge-in: cut speech off mid-sentence
 except ImportError as e:
-    print(f"Warning: Could not import Piper TTS module ({e}). TTS will be disabled.")
+    print(f"Warning: Could not import tts_backends.py ({e}). TTS will be disabled.")
     TTS_ENABLED = False
-    # Define a dummy speak function to avoid errors
+    # Define dummy functions to avoid errors
     def speak(text):
         print(f"Assistant (TTS Disabled): {text}")
+    def stop_speaking():
+        pass
 
 try:
     import local_tools # Import the module itself
@@ -46,11 +55,55 @@ except Exception as e:
          print("----> Did you remember to set 'ALLOWED_READ_DIR' in local_tools.py?")
     exit()
 
+try:
+    import token_usage
+    TOKEN_USAGE_AVAILABLE = True
+except ImportError as e:
+    print(f"Warning: Could not import token_usage.py ({e}). Token accounting disabled.")
+    TOKEN_USAGE_AVAILABLE = False
+
+try:
+    import tool_executor
+    TOOL_EXECUTOR_AVAILABLE = True
+except ImportError as e:
+    print(f"Warning: Could not import tool_executor.py ({e}). Tools will run inline without deadlines.")
+    TOOL_EXECUTOR_AVAILABLE = False
+
+try:
+    import intent_router
+    INTENT_ROUTER_AVAILABLE = True
+except ImportError as e:
+    print(f"Warning: Could not import intent_router.py ({e}). All requests will go to the LLM.")
+    INTENT_ROUTER_AVAILABLE = False
+
+try:
+    import latency_masking
+    LATENCY_MASKING_AVAILABLE = True
+except ImportError as e:
+    print(f"Warning: Could not import latency_masking.py ({e}). Waits for the LLM will be silent.")
+    LATENCY_MASKING_AVAILABLE = False
+
 
 # --- Configuration ---
 # IMPORTANT: Keep your API key secure! Use environment variables or a config file.
+# Which backend answers: "openrouter" (cloud) or "local" (OpenAI-compatible server on this machine,
+# e.g. llama.cpp's llama-server or Ollama). See llm_providers.py for capability flags.
+LLM_PROVIDER = "openrouter"
+LOCAL_LLM_BASE_URL = "http://localhost:8080/v1" # Ollama: "http://localhost:11434/v1"
+LOCAL_LLM_MODEL = "local-model" # Ollama needs the real model name, e.g. "llama3.1:8b"
+LOCAL_LLM_API_KEY = None # Only if your local server was started with an API key
+
+# Stream replies (SSE). Gives time-to-first-token for the adaptive token budget.
+LLM_STREAM_RESPONSES = True
+
+# Hedged requests (opt-in, costs extra tokens): if no first token arrives within the observed p90
+# time-to-first-token, a second request is sent and whichever answers first wins.
+# Per-call-type budgets live in llm_hedging.py (HEDGE_BUDGETS). Needs LLM_STREAM_RESPONSES.
+LLM_HEDGING_ENABLED = False
+HEDGE_ALTERNATE_MODEL = None # e.g. "google/gemini-flash-1.5". None = same model as LLM_MODEL
+
 # Check if the imported key is still the placeholder
-if not OPENROUTER_API_KEY or OPENROUTER_API_KEY == "sk-or-v1-abc...": # Replace with the actual placeholder if different
+if LLM_PROVIDER == "openrouter" and (not OPENROUTER_API_KEY or OPENROUTER_API_KEY == "sk-or-v1-abc..."): # Replace with the actual placeholder if different
     print("Warning: OpenRouter API Key in key.py seems to be a placeholder or empty.")
     print("Please ensure key.py contains your actual OpenRouter API key.")
     # Decide if you want to exit or just warn
@@ -63,6 +116,32 @@ YOUR_APP_NAME = "Assistant_PC_Assistant"
 # Choose your preferred model on OpenRouter
 LLM_MODEL = "google/gemini-2.0-flash-001" # Or "anthropic/claude-3-haiku-20240307", "google/gemini-flash-1.5", etc.
 
+if LLM_PROVIDER == "local":
+    llm_provider = llm_providers.local_provider(base_url=LOCAL_LLM_BASE_URL, model=LOCAL_LLM_MODEL, api_key=LOCAL_LLM_API_KEY)
+else:
+    llm_provider = llm_providers.openrouter_provider(OPENROUTER_API_KEY, LLM_MODEL, site_url=YOUR_SITE_URL, app_name=YOUR_APP_NAME)
+
+llm_hedger = llm_hedging.HedgedRequester(llm_provider, alternate_model=HEDGE_ALTERNATE_MODEL) if LLM_HEDGING_ENABLED else None
+
+# Local intent router: answers trivial tool requests (date, CPU, RAM...) without calling the LLM.
+# Tune the confidence threshold in intent_router.py (CONFIDENCE_THRESHOLD).
+LOCAL_ROUTER_ENABLED = True
+
+# Adaptive output cap: max_tokens is chosen per call type ("chat" / "commentary") from the
+# target time-to-last-audio and the model's observed speed. Targets live in token_usage.py.
+ADAPTIVE_MAX_TOKENS = True
+
+# Filler audio: if the reply takes a while, a short pre-rendered line from the personality core
+# plays and fades out as soon as the real reply is spoken. Timings live in latency_masking.py.
+LATENCY_MASKING_ENABLED = True
+
+# Speech is queued and plays in the background; on exit, wait this long (seconds) for the goodbye line
+EXIT_SPEECH_TIMEOUT = 15
+
+# Token accounting (per turn / per session), persisted to token_usage.USAGE_STORE_FILE
+usage_tracker = token_usage.TokenUsageTracker() if TOKEN_USAGE_AVAILABLE else None
+token_budget = token_usage.AdaptiveTokenBudget(usage_tracker) if TOKEN_USAGE_AVAILABLE else None
+
 
 # --- Assistant Personality Prompt ---
 generic_prompt = """
@@ -76,6 +155,9 @@ Available tools:
 - get_cpu_usage: Reports the current overall CPU utilization percentage. Parameters: None. Use if asked about CPU load/usage.
 - get_memory_info: Reports the current RAM usage statistics (total, used, percentage). Parameters: None. Use if asked about RAM/memory usage.
 - get_disk_usage: Reports disk usage for the primary partition or a specified path. Parameters: {"path": "/path/to/check"} (Optional, defaults to primary disk '/'). Use if asked about disk space.
+- get_directory_sizes: Finds the largest subdirectories (what is taking up disk space). Parameters: {"path": "/path/to/scan", "top_n": 10} (Both optional; path defaults to the designated folder). Use if asked what is eating disk space or which folders are biggest.
+- get_top_processes: Lists the processes using the most CPU or memory. Parameters: {"n": 5, "sort_by": "cpu"} (Both optional; sort_by is "cpu" or "memory"). Use if asked what is hogging the CPU/RAM or which programs are running heavy.
+- system_snapshot: Reports overall system status in one go: CPU (total and per core), memory, swap, all disks, load average, uptime and network traffic, as compact JSON. Parameters: None. Use if asked how the system/PC is doing in general, or for several of these at once, instead of calling the individual tools.
 - get_system_uptime: Reports how long the system has been running since the last boot. Parameters: None. Use if asked about uptime or how long the PC has been on.
 - get_current_datetime: Gets the current system date and time. Parameters: None. Use if asked for the current time or date.
 - send_notification: Sends a desktop notification. Parameters: {"message": "Your message here", "title": "Optional Title"}. Requires 'message', 'title' is optional. Use if asked to send a notification or reminder.
@@ -109,54 +191,62 @@ general_prompt_generic = personality_cores.character_prompt_generic + generic_pr
 ### Uncomment the one you need
 general_prompt = general_prompt_glados
 commentary_prompt = commentary_prompt_glados
+local_reply_templates = personality_cores.local_templates_glados
+filler_lines = personality_cores.filler_lines_glados
 # general_prompt = general_prompt_yandere
 # commentary_prompt = commentary_prompt_yandere
+# local_reply_templates = personality_cores.local_templates_yandere
+# filler_lines = personality_cores.filler_lines_yandere
 #general_prompt = general_prompt_horny
 # commentary_prompt = commentary_prompt_horny
+# local_reply_templates = personality_cores.local_templates_horny
+# filler_lines = personality_cores.filler_lines_horny
 # general_prompt = general_prompt_generic
 # commentary_prompt = commentary_prompt_generic
+# local_reply_templates = personality_cores.local_templates_generic
+# filler_lines = personality_cores.filler_lines_generic
 
-# --- OpenRouter API Call Function ---
-def get_llm_response(conversation_history, system_message, force_text_only=False): # Add new parameter
+# --- LLM API Call Function ---
+def get_llm_response(conversation_history, system_message, force_text_only=False, call_type="chat"): # Add new parameter
     """
-    Sends the conversation history to OpenRouter and gets the LLM response.
-    If force_text_only is True, instructs the API to not use tools.
+    Sends the conversation history to the configured LLM provider and gets the LLM response.
+    If force_text_only is True, instructs the API to not use tools (if the provider supports tool_choice).
+    call_type ("chat" or "commentary") selects the max_tokens budget and is used for token accounting.
     Returns a dictionary:
     - {"type": "standard_tool_call", "name": str, "arguments": dict}
     - {"type": "custom_tool_call", "tool_name": str, "parameters": dict}
     - {"type": "text", "content": str}
     - {"type": "error", "content": str}
     """
-    if not OPENROUTER_API_KEY or OPENROUTER_API_KEY == "sk-or-v1-abc...": # Check placeholder again
+    if llm_provider.credentials_error(): # Check placeholder again
         return {"type": "error", "content": "Error: OpenRouter API Key is missing or invalid in key.py. I can't access the central core without proper credentials. Fix it."}
 
     messages_payload = [{"role": "system", "content": system_message}] + list(conversation_history)
-
-    headers = {
-        "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-        "HTTP-Referer": YOUR_SITE_URL, # Optional
-        "X-Title": YOUR_APP_NAME,      # Optional
-        "Content-Type": "application/json"
-    }
-    data = {
-        "model": LLM_MODEL,
-        "messages": messages_payload,
-        # Set tool_choice based on the new parameter
-        "tool_choice": "none" if force_text_only else "auto",
-         # Consider adding temperature, max_tokens etc. if needed
-         # "temperature": 0.7,
-         # "max_tokens": 250,
-    }
+    max_tokens = token_budget.max_tokens_for(call_type, llm_provider.model) if ADAPTIVE_MAX_TOKENS and token_budget else None
 
     try:
-        response = requests.post(
-            "https://openrouter.ai/api/v1/chat/completions",
-            headers=headers,
-            json=data,
+        request_args = dict(
+            force_text_only=force_text_only,
+            max_tokens=max_tokens,
+            stream=LLM_STREAM_RESPONSES,
             timeout=45 # Set a timeout (seconds)
         )
-        response.raise_for_status() # Raise HTTPError for bad responses (4xx or 5xx)
-        result = response.json()
+        if llm_hedger:
+            result, timing = llm_hedger.chat_completion(messages_payload, call_type=call_type, **request_args)
+        else:
+            result, timing = llm_provider.chat_completion(messages_payload, **request_args)
+        elapsed = timing["elapsed"]
+        answered_by = HEDGE_ALTERNATE_MODEL if timing.get("winner") == "hedge" and HEDGE_ALTERNATE_MODEL else llm_provider.model
+
+        # --- Token accounting ---
+        # With hedging, only the winner's usage is reported; a cancelled loser's partial tokens aren't counted.
+        if usage_tracker and result.get("usage"):
+            include_cached = llm_provider.supports("caching") # Otherwise "cached" counts are meaningless
+            prompt_tokens, completion_tokens, cached_tokens = token_usage.parse_usage(result["usage"], include_cached)
+            token_budget.observe(answered_by, completion_tokens, elapsed, first_token_seconds=timing.get("first_token"))
+            usage_tracker.record(call_type, result["usage"], model=answered_by, include_cached=include_cached)
+            print(f"[Tokens] {call_type}: {prompt_tokens} prompt ({cached_tokens} cached), "
+                  f"{completion_tokens} completion in {elapsed:.2f}s (max_tokens: {max_tokens or 'unset'})")
 
         # Debug: Print raw response (Optional: uncomment for deep debugging)
         # print("\n--- LLM Raw Response ---")
@@ -166,8 +256,8 @@ def get_llm_response(conversation_history, system_message, force_text_only=False
         if 'choices' in result and result['choices']:
             message = result['choices'][0]['message']
 
-            # --- Priority 1: Check for standard tool calls ---
-            if message.get('tool_calls'):
+            # --- Priority 1: Check for standard tool calls (only from providers with native tool support) ---
+            if message.get('tool_calls') and llm_provider.supports("native_tools"):
                 tool_call = message['tool_calls'][0]['function'] # { "name": "...", "arguments": "{...}" }
                 try:
                     arguments = json.loads(tool_call.get("arguments", "{}"))
@@ -197,33 +287,145 @@ def get_llm_response(conversation_history, system_message, force_text_only=False
 
             # --- Priority 3: Return plain text content (if no tool calls found/parsed) ---
             if content:
+                if result['choices'][0].get('finish_reason') == "length" and TOKEN_USAGE_AVAILABLE:
+                    # Hit max_tokens: don't speak half a sentence
+                    return {"type": "text", "content": token_usage.trim_to_sentence(content)}
                 return {"type": "text", "content": content.strip()}
 
         # Fallback / Handle unexpected structure
-        print(f"Warning: Unexpected response structure from OpenRouter: {result}")
+        print(f"Warning: Unexpected response structure from {llm_provider.name}: {result}")
         return {"type": "error", "content": "Error: The response structure from the central core was... non-standard. Testing protocols compromised."}
 
     except requests.exceptions.Timeout:
-        print("Error: Request to OpenRouter timed out.")
+        print(f"Error: Request to {llm_provider.name} timed out.")
         return {"type": "error", "content": "Error: Communication with the central core timed out. Perhaps it got bored waiting for you."}
     except requests.exceptions.RequestException as e:
-        print(f"Error contacting OpenRouter: {e}")
+        print(f"Error contacting {llm_provider.name}: {e}")
         error_detail = ""
         try:
-             if 'response' in locals() and response:
-                 error_detail = response.json().get("error", {}).get("message", "")
+             if getattr(e, "response", None) is not None:
+                 error_detail = e.response.json().get("error", {}).get("message", "")
         except Exception:
              pass
         return {"type": "error", "content": f"Error: Unable to contact the central core. Network issue? Or maybe it just doesn't like you. Details: {e} {error_detail}".strip()}
     except (KeyError, IndexError, json.JSONDecodeError) as e:
-        print(f"Error parsing OpenRouter response: {e}")
+        print(f"Error parsing {llm_provider.name} response: {e}")
         return {"type": "error", "content": "Error: The response from the central core was garbled. Probably your fault."}
 
 
+# --- Local Tool Dispatch ---
+def run_local_tool(tool_name, parameters):
+    """
+    Executes a single local_tools function by name and returns its result text.
+    Parameters are validated here so every caller (LLM tool calls, local router) behaves the same.
+    """
+    if tool_name == "list_safe_directory":
+        return local_tools.list_safe_directory()
+    elif tool_name == "read_safe_file":
+        filename = parameters.get("filename")
+        if filename and isinstance(filename, str):
+            return local_tools.read_safe_file(filename)
+        else:
+            return "You requested to read a file but didn't specify a valid filename. Typical."
+    elif tool_name == "get_cpu_usage":
+        return local_tools.get_cpu_usage()
+    elif tool_name == "get_memory_info":
+        return local_tools.get_memory_info()
+    elif tool_name == "get_disk_usage":
+        path_to_check = parameters.get("path", "/") # Use default if not provided
+        if not isinstance(path_to_check, str): path_to_check = "/" # Sanity check
+        return local_tools.get_disk_usage(path=path_to_check)
+    elif tool_name == "get_directory_sizes":
+        path_to_scan = parameters.get("path")
+        if not isinstance(path_to_scan, str) or not path_to_scan: path_to_scan = None # Use the default
+        top_n = parameters.get("top_n", 10)
+        if not isinstance(top_n, int) or not 1 <= top_n <= 50: top_n = 10 # Sanity check
+        return local_tools.get_directory_sizes(path=path_to_scan, top_n=top_n)
+    elif tool_name == "get_top_processes":
+        count = parameters.get("n", 5)
+        if not isinstance(count, int) or not 1 <= count <= 25: count = 5 # Sanity check
+        sort_by = parameters.get("sort_by", "cpu")
+        if sort_by not in ("cpu", "memory"): sort_by = "cpu"
+        return local_tools.get_top_processes(n=count, sort_by=sort_by)
+    elif tool_name == "system_snapshot":
+        return local_tools.system_snapshot()
+    elif tool_name == "get_system_uptime":
+        return local_tools.get_system_uptime()
+    elif tool_name == "get_current_datetime": # New tool
+        return local_tools.get_current_datetime()
+    elif tool_name == "send_notification": # New tool
+        # Extract parameters, providing defaults
+        message_text = parameters.get("message", "") # Message is required by the tool logic
+        title_text = parameters.get("title", "Assistant Notification") # Default title
+        if message_text: # Only call if message is provided
+             return local_tools.send_notification(title=title_text, message=message_text)
+        else:
+             return "Error: Notification requested without a message. Pointless."
+    else:
+        return f"Error: The central core requested an unknown tool ('{tool_name}'). Protocol violation detected."
+
+
+# Tools run on a worker pool with per-tool deadlines (see tool_executor.py for limits)
+tool_runner = tool_executor.ToolExecutor(run_local_tool) if TOOL_EXECUTOR_AVAILABLE else None
+
+
+def execute_tool(tool_name, parameters):
+    """Runs a tool through the deadline-bounded executor, or inline if it isn't available."""
+    if tool_runner:
+        return tool_runner.execute(tool_name, parameters)
+    return run_local_tool(tool_name, parameters)
+
+
+# Filler clips are pre-rendered in the background right away, so they're ready by the first question
+filler_masker = latency_masking.create_masker(tts, filler_lines) if LATENCY_MASKING_ENABLED and LATENCY_MASKING_AVAILABLE and TTS_ENABLED else None
+
+
+def get_masked_llm_response(conversation_history, system_message, **kwargs):
+    """get_llm_response(), with filler audio covering the wait if it runs long."""
+    if not filler_masker:
+        return get_llm_response(conversation_history, system_message, **kwargs)
+    with filler_masker.cover():
+        return get_llm_response(conversation_history, system_message, **kwargs)
+
+
+# --- Local Routing ---
+def try_local_route(user_input):
+    """
+    Runs the local intent router on the user input.
+    If a trivial tool request is recognized with enough confidence, executes the tool and
+    returns the in-character reply text. Returns None if the request should go to the LLM.
+    """
+    if not (LOCAL_ROUTER_ENABLED and INTENT_ROUTER_AVAILABLE):
+        return None
+
+    start = time.perf_counter()
+    decision = intent_router.route(user_input)
+    if decision["route"] != "local":
+        intent_router.log_decision(user_input, decision)
+        return None
+
+    try:
+        tool_result_text = execute_tool(decision["tool_name"], {})
+    except Exception as e:
+        intent_router.log_decision(user_input, decision, total_ms=(time.perf_counter() - start) * 1000, note=f"tool exception: {e}")
+        return None
+
+    # Let the LLM deal with failures, it has more to say about them
+    if not tool_result_text or "Error" in tool_result_text:
+        intent_router.log_decision(user_input, decision, total_ms=(time.perf_counter() - start) * 1000, note="tool error, falling back to LLM")
+        return None
+
+    reply = intent_router.render_reply(decision["tool_name"], tool_result_text, local_reply_templates)
+    intent_router.log_decision(user_input, decision, handled_locally=True, total_ms=(time.perf_counter() - start) * 1000)
+    return reply
+
+
 # --- Main Interaction Loop ---
 def main():
     """Runs the main input/output loop for the assistant."""
     print("Assistant Initializing...")
+    # CPU baseline for get_top_processes, so the first "what's hogging my CPU?" doesn't have to wait
+    threading.Thread(target=local_tools.prime_process_baseline, daemon=True).start()
     conversation_history = deque(maxlen=10) # Store last 10 messages (5 turns)
 
     if TTS_ENABLED:
@@ -243,6 +445,7 @@ def main():
     while True:
         try:
             user_input = input("You: ")
+            stop_speaking() # The user typed something new, so stop talking over them
             if user_input.lower().strip() in ["quit", "exit", "bye", "goodbye"]:
                 speak("Fine. Abandon the test. See if I care.")
                 break
@@ -251,9 +454,18 @@ def main():
 
             # Add user message to history
             conversation_history.append({"role": "user", "content": user_input})
+            if usage_tracker:
+                usage_tracker.start_turn()
+
+            # Trivial requests are answered locally, skipping the network entirely
+            local_reply = try_local_route(user_input)
+            if local_reply is not None:
+                speak(local_reply)
+                conversation_history.append({"role": "assistant", "content": local_reply})
+                continue
 
             # Get structured response from LLM
-            llm_response = get_llm_response(conversation_history, general_prompt)
+            llm_response = get_masked_llm_response(conversation_history, general_prompt)
 
             response_type = llm_response.get("type")
             tool_result_text = None # To store the output of a successfully executed tool
@@ -278,36 +490,7 @@ def main():
 
                 try:
                     # --- Execute Tool ---
-                    if tool_name == "list_safe_directory":
-                        tool_result_text = local_tools.list_safe_directory()
-                    elif tool_name == "read_safe_file":
-                        filename = parameters.get("filename")
-                        if filename and isinstance(filename, str):
-                            tool_result_text = local_tools.read_safe_file(filename)
-                        else:
-                            tool_result_text = "You requested to read a file but didn't specify a valid filename. Typical."
-                    elif tool_name == "get_cpu_usage":
-                        tool_result_text = local_tools.get_cpu_usage()
-                    elif tool_name == "get_memory_info":
-                        tool_result_text = local_tools.get_memory_info()
-                    elif tool_name == "get_disk_usage":
-                        path_to_check = parameters.get("path", "/") # Use default if not provided
-                        if not isinstance(path_to_check, str): path_to_check = "/" # Sanity check
-                        tool_result_text = local_tools.get_disk_usage(path=path_to_check)
-                    elif tool_name == "get_system_uptime":
-                        tool_result_text = local_tools.get_system_uptime()
-                    elif tool_name == "get_current_datetime": # New tool
-                        tool_result_text = local_tools.get_current_datetime()
-                    elif tool_name == "send_notification": # New tool
-                        # Extract parameters, providing defaults
-                        message_text = parameters.get("message", "") # Message is required by the tool logic
-                        title_text = parameters.get("title", "Assistant Notification") # Default title
-                        if message_text: # Only call if message is provided
-                             tool_result_text = local_tools.send_notification(title=title_text, message=message_text)
-                        else:
-                             tool_result_text = "Error: Notification requested without a message. Pointless."
-                    else:
-                        tool_result_text = f"Error: The central core requested an unknown tool ('{tool_name}'). Protocol violation detected."
+                    tool_result_text = execute_tool(tool_name, parameters)
 
 
                     # --- Handle Tool Result (New Workflow with Abstract System Observation) ---
@@ -327,7 +510,7 @@ def main():
 
                         # 2. Call LLM again using the specific commentary prompt and forcing text only
                         print("Getting Assistant commentary on system observation...")
-                        final_llm_response = get_llm_response(conversation_history, commentary_prompt, force_text_only=True) # Use commentary prompt & force text
+                        final_llm_response = get_masked_llm_response(conversation_history, commentary_prompt, force_text_only=True, call_type="commentary") # Use commentary prompt & force text
                         final_response_type = final_llm_response.get("type")
 
                         # 3. Process the commentary response
@@ -372,7 +555,7 @@ def main():
                     conversation_history.append({"role": "system", "content": system_observation})
                     # Immediately try to get commentary on the execution error using the specific commentary prompt
                     print("Getting Assistant commentary on tool execution error...")
-                    final_llm_response = get_llm_response(conversation_history, commentary_prompt, force_text_only=True) # Use commentary prompt & force text
+                    final_llm_response = get_masked_llm_response(conversation_history, commentary_prompt, force_text_only=True, call_type="commentary") # Use commentary prompt & force text
                     # (Processing logic is the same as above for commentary)
                     final_response_type = final_llm_response.get("type")
                     if final_response_type == "text":
@@ -429,26 +612,33 @@ def main():
              speak("A critical error occurred. This is usually where the test subject... spontaneously combusts. Watch out.")
              # Consider adding a small delay or exiting depending on severity
              time.sleep(2) # Short pause after critical error
+        finally:
+            if usage_tracker:
+                turn = usage_tracker.end_turn()
+                if turn and turn["calls"]:
+                    print(f"[Tokens] {usage_tracker.turn_summary(turn)}")
+
+    if TTS_ENABLED:
+        try:
+            tts.wait_until_done(timeout=EXIT_SPEECH_TIMEOUT) # Let the goodbye line finish
+        except KeyboardInterrupt:
+            pass
+    if usage_tracker:
+        print(usage_tracker.session_summary())
+    if tool_runner:
+        print(tool_runner.format_stats())
+    if llm_hedger:
+        print(llm_hedger.format_stats())
+    if filler_masker:
+        print(filler_masker.format_stats())
+    if TTS_ENABLED and tts.format_stats():
+        print(tts.format_stats())
 
 
 if __name__ == "__main__":
     # Basic checks before starting
     # Removed the fatal exit check for API key here, warnings are handled during import and usage.
 
-    # Check Piper config placeholders if TTS is enabled
-    if TTS_ENABLED:
-        # Need to import tts_piper to check its variables
-        try:
-            import tts_piper
-        except ImportError:
-             # Already handled at the top, but good practice to be safe
-             pass
-
-        if tts_piper.VOICE_MODEL == "./path/to/your/voice.onnx":
-            print("WARNING: Piper voice model path not configured in tts_piper.py")
-        if not shutil.which("piper") and tts_piper.PIPER_EXE is None:
-             print("WARNING: Piper executable not found in PATH and not explicitly set in tts_piper.py")
-
     # Check File Access config placeholder
     if local_tools.ALLOWED_READ_DIR == "/path/to/your/designated/safe/folder":
         print("WARNING: ALLOWED_READ_DIR is not configured in local_tools.py. File operations may fail.")
@@ -0,0 +1,385 @@
+# synth_pool.py
+# Parallel multi-sentence synthesis.
+# Splits text into sentences, synthesizes them concurrently on a pool of warm Piper workers
+# and hands the audio to playback strictly in order.
+# Playback starts as soon as sentence 1 is ready; later sentences are usually done by then.
+# Each worker is one long-lived 'piper --json-input' process, so the voice model is loaded once
+# per worker instead of once per sentence. Workers are pinned to their own cores so that
+# workers x THREADS_PER_WORKER stays within the CPU count.
+
+import json
+import os
+import queue
+import re
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+import wave
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+try:
+    import psutil # For CPU affinity where os.sched_setaffinity doesn't exist (Windows, macOS)
+    PSUTIL_AVAILABLE = True
+except ImportError:
+    PSUTIL_AVAILABLE = False
+
+# --- Configuration ---
+# Number of warm Piper workers. None = CPU count // THREADS_PER_WORKER.
+POOL_SIZE = None
+
+# Cores each worker may use. onnxruntime would otherwise start one thread per core in every
+# worker and oversubscribe the CPU. 1 = most sentences in parallel, higher = faster single sentences.
+THREADS_PER_WORKER = 2
+
+# Sentences shorter than this (in characters) are merged into the next one.
+# Very short fragments cost more in scheduling overhead than they save.
+MIN_SENTENCE_CHARS = 20
+
+# How often (seconds) a wait for the next sentence checks whether speech was cancelled.
+CANCEL_POLL_INTERVAL = 0.05
+
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?])\s+")
+
+
+def split_sentences(text, min_chars=MIN_SENTENCE_CHARS):
+    """Splits text at sentence boundaries, merging fragments shorter than min_chars."""
+    parts = [p.strip() for p in _SENTENCE_END_RE.split(text.strip()) if p.strip()]
+    sentences = []
+    pending = ""
+    for part in parts:
+        pending = f"{pending} {part}".strip() if pending else part
+        if len(pending) >= min_chars:
+            sentences.append(pending)
+            pending = ""
+    if pending:
+        if sentences and len(pending) < min_chars:
+            sentences[-1] = f"{sentences[-1]} {pending}"
+        else:
+            sentences.append(pending)
+    return sentences
+
+
+class PiperWorkerError(Exception):
+    """A Piper worker process failed to start or died while synthesizing."""
+
+
+class PiperWorker:
+    """
+    One long-lived Piper process fed JSON lines ({"text", "output_file"}) on stdin.
+    Piper prints each finished file's path on stdout, which is the cue to read it.
+    """
+
+    def __init__(self, command, name, cpus=None):
+        self.command = list(command) # Piper executable, model and config; JSON options are added here
+        self.name = name
+        self.cpus = cpus # Cores this worker is pinned to, or None for all
+        self.process = None
+        self.starts = 0
+        self.last_start_seconds = None # Spawn time only; the model finishes loading in the background
+        self._lock = threading.Lock() # Guards starting/killing the process
+        self._counter = 0
+        self._stderr_tail = deque(maxlen=20)
+        self._dir = tempfile.mkdtemp(prefix="piper_worker_")
+
+    def start(self):
+        """Starts the process if it isn't running. The model loads while the first line is pending."""
+        with self._lock:
+            if self.process is not None and self.process.poll() is None:
+                return
+            start = time.perf_counter()
+            env = dict(os.environ)
+            if self.cpus:
+                env["OMP_NUM_THREADS"] = str(len(self.cpus)) # For onnxruntime builds that use OpenMP
+            try:
+                self.process = subprocess.Popen(
+                    self.command + ["--json-input", "--output_dir", self._dir],
+                    stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env)
+            except OSError as e:
+                self.process = None
+                raise PiperWorkerError(f"Could not start Piper worker: {e}")
+            self._set_affinity(self.process.pid)
+            self.process.aborted = False
+            self._stderr_tail.clear()
+            threading.Thread(target=self._drain_stderr, args=(self.process,), name=f"{self.name}_stderr",
+                             daemon=True).start()
+            self.starts += 1
+            self.last_start_seconds = time.perf_counter() - start
+
+    def _set_affinity(self, pid):
+        if not self.cpus:
+            return
+        try:
+            if hasattr(os, "sched_setaffinity"):
+                os.sched_setaffinity(pid, self.cpus)
+            elif PSUTIL_AVAILABLE:
+                psutil.Process(pid).cpu_affinity(list(self.cpus))
+        except (OSError, AttributeError, ValueError) as e: # psutil errors are OSError subclasses
+            print(f"Warning: Could not pin {self.name} to cores {self.cpus}: {e}")
+
+    def _drain_stderr(self, process):
+        """Piper logs to stderr; reading it keeps the pipe from filling up and keeps the tail for errors."""
+        for line in process.stderr:
+            self._stderr_tail.append(line.decode("utf-8", errors="ignore").rstrip())
+
+    def synthesize(self, text):
+        """Returns int16 PCM bytes, or None if abort() interrupted it. Raises PiperWorkerError on failure."""
+        self.start()
+        process = self.process
+        self._counter += 1
+        output_file = os.path.join(self._dir, f"{self._counter}.wav")
+        try:
+            line = json.dumps({"text": text, "output_file": output_file}) + "\n"
+            process.stdin.write(line.encode("utf-8"))
+            process.stdin.flush()
+            done = process.stdout.readline().decode("utf-8", errors="ignore").strip()
+        except OSError:
+            done = ""
+        if not done:
+            if process.aborted: # Checked on this process: abort() may have started a new one since
+                return None
+            process.wait()
+            tail = " | ".join(list(self._stderr_tail)[-3:])
+            raise PiperWorkerError(f"Piper worker exited (return code {process.returncode}). Stderr: {tail}")
+        path = done if os.path.isfile(done) else output_file
+        try:
+            with wave.open(path, "rb") as wav:
+                pcm = wav.readframes(wav.getnframes())
+        except (OSError, EOFError, wave.Error) as e:
+            raise PiperWorkerError(f"Could not read Piper output '{path}': {e}")
+        finally:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        return pcm[:len(pcm) - (len(pcm) % 2)]
+
+    def abort(self):
+        """Kills the process mid-sentence (barge-in). The next synthesize() starts a new one."""
+        with self._lock:
+            if self.process is not None and self.process.poll() is None:
+                self.process.aborted = True
+                try:
+                    self.process.kill()
+                    self.process.wait(timeout=1.0) # Reaped, so start() sees it as gone
+                except (OSError, subprocess.TimeoutExpired):
+                    pass
+
+    def close(self):
+        self.abort()
+        shutil.rmtree(self._dir, ignore_errors=True)
+
+
+class PiperWorkerPool:
+    """
+    Warm Piper workers for SynthesisScheduler. Each scheduler thread gets its own worker, so
+    synthesize() can be used directly as the scheduler's synthesize_fn.
+    """
+
+    def __init__(self, command, size=None, threads_per_worker=None):
+        threads = threads_per_worker or THREADS_PER_WORKER
+        cores = _available_cpus()
+        self.size = size or POOL_SIZE or max(1, len(cores) // threads)
+        self.workers = []
+        for i in range(self.size):
+            # Disjoint core sets while they last; beyond that workers share (wrapping around)
+            cpus = [cores[(i * threads + j) % len(cores)] for j in range(min(threads, len(cores)))]
+            self.workers.append(PiperWorker(command, f"PiperWorker_{i}", cpus=cpus if self.size > 1 else None))
+        self._assigned = threading.local()
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def prewarm(self, background=True):
+        """Starts every worker that isn't running, so the next reply doesn't pay for model loading."""
+        def start_all():
+            for worker in self.workers:
+                try:
+                    worker.start()
+                except PiperWorkerError as e:
+                    print(f"Warning: {e}")
+        if background:
+            threading.Thread(target=start_all, name="PiperPrewarm", daemon=True).start()
+        else:
+            start_all()
+
+    def _worker(self):
+        worker = getattr(self._assigned, "worker", None)
+        if worker is None:
+            with self._lock:
+                worker = self.workers[self._next % self.size]
+                self._next += 1
+            self._assigned.worker = worker
+        return worker
+
+    def synthesize(self, text):
+        """Synthesizes on the calling thread's worker. None if interrupted by abort()."""
+        return self._worker().synthesize(text)
+
+    def abort(self):
+        """Barge-in: kills every worker mid-sentence, then warms them up again in the background."""
+        for worker in self.workers:
+            worker.abort()
+        self.prewarm()
+
+    def stats(self):
+        return {worker.name: {"cpus": worker.cpus, "starts": worker.starts} for worker in self.workers}
+
+    def close(self):
+        for worker in self.workers:
+            worker.close()
+
+
+def _available_cpus():
+    """Core IDs this process may run on."""
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    if PSUTIL_AVAILABLE:
+        try:
+            return sorted(psutil.Process().cpu_affinity())
+        except (OSError, AttributeError):
+            pass
+    return list(range(os.cpu_count() or 1))
+
+
+class SynthesisScheduler:
+    """
+    Runs a synthesize function over sentences in parallel and delivers results in order.
+    synthesize_fn(text) must return raw int16 mono PCM bytes at sample_rate.
+    """
+
+    def __init__(self, synthesize_fn, sample_rate, pool_size=None):
+        self.synthesize_fn = synthesize_fn
+        self.sample_rate = sample_rate
+        self.pool_size = pool_size or POOL_SIZE or os.cpu_count() or 1
+        self.executor = ThreadPoolExecutor(max_workers=self.pool_size, thread_name_prefix="PiperWorker")
+
+        # Stats: per worker thread name -> [synth_seconds, audio_seconds, sentences]
+        self._stats_lock = threading.Lock()
+        self.worker_stats = {}
+        self.total_wall_seconds = 0.0
+        self.total_audio_seconds = 0.0
+        self.first_audio_latencies = []
+
+    def _timed_synthesis(self, text, engine=None, generation=None):
+        """Worker task: synthesizes one sentence and records how long it took."""
+        if engine is not None and engine.generation != generation:
+            return b"" # Cancelled while queued: don't start another synthesis
+        start = time.perf_counter()
+        pcm = self.synthesize_fn(text)
+        elapsed = time.perf_counter() - start
+        audio_seconds = len(pcm or b"") / 2 / self.sample_rate
+        worker = threading.current_thread().name
+        with self._stats_lock:
+            entry = self.worker_stats.setdefault(worker, [0.0, 0.0, 0])
+            entry[0] += elapsed
+            entry[1] += audio_seconds
+            entry[2] += 1
+        return pcm or b""
+
+    def speak(self, text, engine, generation=None, dsp=None):
+        """
+        Synthesizes text sentence-by-sentence in parallel and feeds the playback engine in order.
+        If given, dsp (an audio_dsp.DSPChain) post-processes the audio on its way to playback.
+        Stops early (and drops pending sentences) if the engine is cancelled.
+        Returns the number of sentences played.
+        """
+        if generation is None:
+            generation = engine.generation
+        sentences = split_sentences(text)
+        if not sentences:
+            return 0
+
+        if dsp:
+            dsp.reset()
+        start = time.perf_counter()
+        futures = [self.executor.submit(self._timed_synthesis, s, engine, generation) for s in sentences]
+        played = 0
+        audio_seconds = 0.0
+        try:
+            for future in futures:
+                pcm = self._wait_for(future, engine, generation)
+                if pcm is None or engine.generation != generation:
+                    break # Barge-in happened while we were waiting
+                if played == 0:
+                    self.first_audio_latencies.append(time.perf_counter() - start)
+                if dsp:
+                    for processed in dsp.process_iter(pcm):
+                        engine.enqueue(processed)
+                else:
+                    engine.enqueue(pcm)
+                audio_seconds += len(pcm) / 2 / self.sample_rate
+                played += 1
+        except Exception as e:
+            print(f"\nError during parallel synthesis: {e}")
+        finally:
+            for future in futures:
+                future.cancel() # No-op for sentences already done or running
+            if engine.generation == generation:
+                if dsp:
+                    engine.enqueue(dsp.flush())
+                engine.end_stream()
+
+        with self._stats_lock:
+            self.total_wall_seconds += time.perf_counter() - start
+            self.total_audio_seconds += audio_seconds
+        return played
+
+    @staticmethod
+    def _wait_for(future, engine, generation):
+        """Waits for a sentence's audio, giving up (None) as soon as the engine is cancelled."""
+        while True:
+            try:
+                return future.result(timeout=CANCEL_POLL_INTERVAL)
+            except FutureTimeoutError:
+                if engine.generation != generation:
+                    return None
+
+    def stats(self):
+        """
+        Returns real-time factors (synthesis time / audio duration, lower is better).
+        "overall_rtf" uses wall-clock time, so it reflects the speed-up from running in parallel.
+        """
+        with self._stats_lock:
+            workers = {
+                name: {
+                    "sentences": count,
+                    "rtf": round(synth / audio, 3) if audio else None,
+                }
+                for name, (synth, audio, count) in self.worker_stats.items()
+            }
+            first = self.first_audio_latencies
+            return {
+                "pool_size": self.pool_size,
+                "workers": workers,
+                "overall_rtf": round(self.total_wall_seconds / self.total_audio_seconds, 3) if self.total_audio_seconds else None,
+                "avg_first_audio_ms": round(sum(first) / len(first) * 1000, 1) if first else None,
+            }
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+# --- Self-test (uses a fake synthesizer, no Piper needed) ---
+if __name__ == '__main__':
+    import audio_playback
+
+    def _fake_synth(text, rate=22050):
+        time.sleep(0.01 * len(text)) # Pretend synthesis takes ~half real time
+        return b"\x00\x00" * int(rate * 0.02 * len(text))
+
+    monologue = ("Hello, and again, welcome to the Aperture Science computer-aided enrichment center. "
+                 "We hope your brief detention in the relaxation vault has been a pleasant one. "
+                 "Your specimen has been processed and we are now ready to begin the test proper. "
+                 "Before we start, however, keep in mind that although fun and learning are the primary goals "
+                 "of all enrichment center activities, serious injuries may occur.")
+    engine = audio_playback.PlaybackEngine(sink=audio_playback.NullSink(realtime=True))
+    scheduler = SynthesisScheduler(_fake_synth, sample_rate=22050)
+    print(f"Sentences: {split_sentences(monologue)}")
+    scheduler.speak(monologue, engine)
+    engine.wait()
+    print("Scheduler stats:", scheduler.stats())
+    print("Playback stats:", engine.stats())
+    scheduler.shutdown()
+    engine.close()
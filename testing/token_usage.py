@@ -0,0 +1,208 @@
+# token_usage.py
+# Token accounting for LLM calls plus an adaptive max_tokens budget.
+# - TokenUsageTracker: per-turn and per-session prompt/completion/cached token counts,
+#   persisted (with a log of recent turns) to a small local JSON store so totals survive restarts.
+# - AdaptiveTokenBudget: picks max_tokens per call type from a target time-to-last-audio
+#   and the observed generation speed (tokens/sec) of the model.
+
+import json
+import os
+import time
+
+# --- Configuration ---
+USAGE_STORE_FILE = "token_usage.json"
+MAX_STORED_SESSIONS = 50 # Older session summaries are dropped from the store
+MAX_STORED_TURNS = 100 # Per-turn records kept in each stored session (oldest are dropped)
+
+# Target time from sending the request until the last audio of the reply is synthesized (seconds).
+TARGET_SECONDS = {
+    "chat": 8.0,
+    "commentary": 5.0,
+}
+# Hard limits for each call type, whatever the estimate says.
+TOKEN_BOUNDS = {
+    "chat": (64, 400),
+    "commentary": (32, 200),
+}
+DEFAULT_CALL_TYPE = "chat"
+
+# Starting estimates, used until real measurements come in.
+DEFAULT_TOKENS_PER_SECOND = 60.0
+DEFAULT_OVERHEAD_SECONDS = 0.8 # Network + queueing + time to first token
+# Extra synthesis time per generated token (roughly 0.75 words/token at Piper's speed).
+TTS_SECONDS_PER_TOKEN = 0.05
+# Weight of the newest measurement in the running averages.
+EMA_ALPHA = 0.3
+
+
+def _empty_counts():
+    return {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0}
+
+
+def _add_counts(counts, prompt, completion, cached):
+    counts["calls"] += 1
+    counts["prompt_tokens"] += prompt
+    counts["completion_tokens"] += completion
+    counts["cached_tokens"] += cached
+
+
+def parse_usage(usage, include_cached=True):
+    """
+    Extracts (prompt, completion, cached) token counts from an OpenAI-style usage block.
+    include_cached=False reports 0 cached tokens, for providers without prompt caching.
+    """
+    if not isinstance(usage, dict):
+        return 0, 0, 0
+    prompt = int(usage.get("prompt_tokens") or 0)
+    completion = int(usage.get("completion_tokens") or 0)
+    cached = 0
+    if include_cached:
+        details = usage.get("prompt_tokens_details") or {}
+        cached = int(details.get("cached_tokens") or usage.get("cached_tokens") or 0)
+    return prompt, completion, cached
+
+
+class TokenUsageTracker:
+    """Accumulates token usage per turn, per session and over the lifetime of the store."""
+
+    def __init__(self, store_path=USAGE_STORE_FILE):
+        self.store_path = store_path
+        self.store = self._load()
+        self.session = {
+            "started": time.time(),
+            "turns": 0,
+            "by_call_type": {},
+            **_empty_counts(),
+        }
+        self.turn = None
+
+    # --- Persistence ---
+    def _load(self):
+        store = {"lifetime": _empty_counts(), "sessions": [], "models": {}}
+        if self.store_path and os.path.isfile(self.store_path):
+            try:
+                with open(self.store_path, "r", encoding="utf-8") as f:
+                    loaded = json.load(f)
+                if isinstance(loaded, dict):
+                    store.update(loaded)
+            except (OSError, ValueError) as e:
+                print(f"Warning: Could not read token usage store '{self.store_path}': {e}")
+        return store
+
+    def save(self):
+        """Writes the store atomically (temp file + rename) so a crash can't corrupt it."""
+        if not self.store_path:
+            return
+        sessions = [s for s in self.store.get("sessions", []) if s.get("started") != self.session["started"]]
+        sessions.append({k: v for k, v in self.session.items()})
+        self.store["sessions"] = sessions[-MAX_STORED_SESSIONS:]
+        tmp_path = self.store_path + ".tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.store, f, indent=1)
+            os.replace(tmp_path, self.store_path)
+        except OSError as e:
+            print(f"Warning: Could not save token usage store '{self.store_path}': {e}")
+
+    # --- Accounting ---
+    def start_turn(self):
+        """Begins a new user turn. A turn may contain several calls (tool call + commentary)."""
+        if self.turn is not None:
+            self.end_turn()
+        self.session["turns"] += 1
+        self.turn = {"turn": self.session["turns"], "started": time.time(), "call_types": [], **_empty_counts()}
+        return self.turn
+
+    def end_turn(self):
+        """Closes the current turn and keeps it in the session's turn log. Returns the turn, or None."""
+        turn, self.turn = self.turn, None
+        if turn is None:
+            return None
+        if turn["calls"]: # Turns answered locally cost nothing and aren't worth storing
+            turn_log = self.session.setdefault("turn_log", [])
+            turn_log.append(turn)
+            del turn_log[:-MAX_STORED_TURNS]
+            self.save()
+        return turn
+
+    def record(self, call_type, usage, model=None, include_cached=True):
+        """Adds one LLM call's usage block to the turn, session and lifetime totals."""
+        prompt, completion, cached = parse_usage(usage, include_cached)
+        if self.turn is None:
+            self.start_turn()
+        _add_counts(self.turn, prompt, completion, cached)
+        self.turn["call_types"].append(call_type)
+        _add_counts(self.session, prompt, completion, cached)
+        _add_counts(self.session["by_call_type"].setdefault(call_type, _empty_counts()), prompt, completion, cached)
+        _add_counts(self.store["lifetime"], prompt, completion, cached)
+        if model:
+            self.session["model"] = model
+        self.save()
+        return prompt, completion, cached
+
+    @staticmethod
+    def format_counts(counts):
+        return (f"{counts['prompt_tokens']} prompt ({counts['cached_tokens']} cached), "
+                f"{counts['completion_tokens']} completion over {counts['calls']} call(s)")
+
+    def turn_summary(self, turn=None):
+        turn = turn or self.turn
+        return f"Turn token usage: {self.format_counts(turn)}." if turn else "No turn recorded."
+
+    def session_summary(self):
+        return f"Session token usage: {self.format_counts(self.session)}, {self.session['turns']} turn(s)."
+
+
+class AdaptiveTokenBudget:
+    """
+    Chooses max_tokens so that overhead + tokens/tps + tokens*TTS_SECONDS_PER_TOKEN fits the
+    target for the call type. Generation speed and overhead are learned per model and kept
+    in the tracker's store so the next session starts with good estimates.
+    """
+
+    def __init__(self, tracker=None):
+        self.tracker = tracker
+        self.models = tracker.store.setdefault("models", {}) if tracker else {}
+
+    def _model_stats(self, model):
+        return self.models.setdefault(model or "default", {
+            "tokens_per_second": DEFAULT_TOKENS_PER_SECOND,
+            "overhead_seconds": DEFAULT_OVERHEAD_SECONDS,
+            "samples": 0,
+        })
+
+    def max_tokens_for(self, call_type, model=None):
+        """Returns the max_tokens cap for this kind of call."""
+        stats = self._model_stats(model)
+        target = TARGET_SECONDS.get(call_type, TARGET_SECONDS[DEFAULT_CALL_TYPE])
+        low, high = TOKEN_BOUNDS.get(call_type, TOKEN_BOUNDS[DEFAULT_CALL_TYPE])
+        budget_seconds = max(0.0, target - stats["overhead_seconds"])
+        seconds_per_token = 1.0 / max(stats["tokens_per_second"], 1.0) + TTS_SECONDS_PER_TOKEN
+        return int(max(low, min(high, budget_seconds / seconds_per_token)))
+
+    def observe(self, model, completion_tokens, elapsed_seconds, first_token_seconds=None):
+        """Updates the speed estimate from one finished call."""
+        if completion_tokens <= 0 or elapsed_seconds <= 0:
+            return
+        stats = self._model_stats(model)
+        if first_token_seconds is not None:
+            # Streaming gives us the overhead directly
+            stats["overhead_seconds"] += EMA_ALPHA * (first_token_seconds - stats["overhead_seconds"])
+            generation_seconds = elapsed_seconds - first_token_seconds
+        else:
+            generation_seconds = elapsed_seconds - stats["overhead_seconds"]
+        # Guard against tiny replies where overhead dominates the measurement
+        generation_seconds = max(generation_seconds, elapsed_seconds * 0.2)
+        tps = completion_tokens / generation_seconds
+        stats["tokens_per_second"] += EMA_ALPHA * (tps - stats["tokens_per_second"])
+        stats["samples"] += 1
+
+
+def trim_to_sentence(text):
+    """Cuts a reply that hit max_tokens back to its last complete sentence, if there is one."""
+    cut = max(text.rfind(". "), text.rfind("! "), text.rfind("? "), text.rfind(".\n"))
+    if text.rstrip().endswith((".", "!", "?")):
+        return text.strip()
+    if cut > 0:
+        return text[:cut + 1].strip()
+    return text.strip() + "..."
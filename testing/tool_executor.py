@@ -0,0 +1,202 @@
+# tool_executor.py
+# Runs local tool calls on a worker pool with per-tool deadlines, so a hung tool
+# (stale network mount, dead D-Bus, slow disk) can't freeze the chat loop.
+# - Results that arrive after the deadline are discarded.
+# - A tool that keeps timing out is quarantined for a while.
+# - Fire-and-forget tools return immediately; their outcome is only logged.
+# - Per-tool latency histograms and timeout counts are kept for tuning.
+
+import bisect
+import threading
+import time
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from daemon_pool import DaemonThreadPool
+
+# --- Configuration ---
+# Seconds each tool may take before its result is abandoned.
+DEFAULT_DEADLINE = 5.0
+TOOL_DEADLINES = {
+    "get_current_datetime": 1.0,
+    "get_memory_info": 2.0,
+    "get_system_uptime": 2.0,
+    "get_cpu_usage": 3.0, # Samples for 0.5 s
+    "get_disk_usage": 3.0,
+    "get_top_processes": 2.0,
+    "system_snapshot": 2.0, # Has its own 1 s time budget and leaves out readings that miss it
+    "list_safe_directory": 3.0,
+    "read_safe_file": 5.0,
+    "get_directory_sizes": 6.0, # Has its own 3 s time budget and returns partial results
+}
+
+# Tools whose result the conversation doesn't depend on. They return at once.
+FIRE_AND_FORGET_TOOLS = {"send_notification"}
+# ...after waiting this long, so instant failures (e.g. a missing message) are still reported.
+FIRE_AND_FORGET_GRACE = 0.05
+
+# After this many timeouts in a row, the tool is refused for QUARANTINE_SECONDS.
+QUARANTINE_AFTER_TIMEOUTS = 2
+QUARANTINE_SECONDS = 300
+
+# Hung calls keep their worker thread busy, so leave headroom.
+MAX_WORKERS = 8
+
+# Latency histogram bucket upper bounds (milliseconds). The last bucket catches everything above.
+HISTOGRAM_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+
+class _ToolStats:
+    def __init__(self):
+        self.calls = 0
+        self.completed = 0
+        self.timeouts = 0
+        self.late_results = 0
+        self.errors = 0
+        self.consecutive_timeouts = 0
+        self.quarantined_until = 0.0
+        self.histogram = [0] * (len(HISTOGRAM_BUCKETS_MS) + 1)
+
+    def add_latency(self, ms):
+        self.histogram[bisect.bisect_left(HISTOGRAM_BUCKETS_MS, ms)] += 1
+
+
+class ToolExecutor:
+    """
+    Wraps a dispatch function run_fn(tool_name, parameters) -> result text.
+    execute() has the same contract, but never blocks longer than the tool's deadline.
+    """
+
+    def __init__(self, run_fn, max_workers=MAX_WORKERS):
+        self.run_fn = run_fn
+        # Daemon workers: a tool hung past its deadline must not block interpreter exit either
+        self.pool = DaemonThreadPool(max_workers=max_workers, thread_name_prefix="ToolWorker")
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def _tool_stats(self, tool_name):
+        with self._lock:
+            return self._stats.setdefault(tool_name, _ToolStats())
+
+    def deadline_for(self, tool_name):
+        return TOOL_DEADLINES.get(tool_name, DEFAULT_DEADLINE)
+
+    def is_quarantined(self, tool_name):
+        stats = self._tool_stats(tool_name)
+        return time.monotonic() < stats.quarantined_until
+
+    def _run_timed(self, tool_name, parameters, deadline_state):
+        """Worker: runs the tool and records its latency, even if the caller already gave up."""
+        stats = self._tool_stats(tool_name)
+        start = time.perf_counter()
+        try:
+            return self.run_fn(tool_name, parameters)
+        except Exception:
+            with self._lock:
+                stats.errors += 1
+            raise
+        finally:
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            with self._lock:
+                stats.completed += 1
+                stats.add_latency(elapsed_ms)
+                if deadline_state["expired"]:
+                    stats.late_results += 1
+                    print(f"[Tools] Late result from '{tool_name}' after {elapsed_ms:.0f} ms discarded.")
+                else:
+                    stats.consecutive_timeouts = 0
+
+    def execute(self, tool_name, parameters):
+        """
+        Runs a tool with its deadline. Returns the tool's result text, or an "Error: ..." string on
+        timeout/quarantine. Exceptions raised by the tool itself are re-raised, as if called inline.
+        """
+        stats = self._tool_stats(tool_name)
+        now = time.monotonic()
+        if now < stats.quarantined_until:
+            remaining = int(stats.quarantined_until - now)
+            return (f"Error: Tool '{tool_name}' is quarantined after repeated timeouts. "
+                    f"It will be retried in {remaining} seconds.")
+
+        with self._lock:
+            stats.calls += 1
+        deadline_state = {"expired": False}
+        future = self.pool.submit(self._run_timed, tool_name, parameters, deadline_state)
+
+        if tool_name in FIRE_AND_FORGET_TOOLS:
+            try:
+                return future.result(timeout=FIRE_AND_FORGET_GRACE)
+            except FutureTimeoutError:
+                future.add_done_callback(lambda f: self._log_background_result(tool_name, f))
+                return f"Result: '{tool_name}' dispatched in the background."
+
+        deadline = self.deadline_for(tool_name)
+        try:
+            return future.result(timeout=deadline)
+        except FutureTimeoutError:
+            with self._lock:
+                deadline_state["expired"] = True
+                stats.timeouts += 1
+                stats.consecutive_timeouts += 1
+                if stats.consecutive_timeouts >= QUARANTINE_AFTER_TIMEOUTS:
+                    stats.quarantined_until = time.monotonic() + QUARANTINE_SECONDS
+                    print(f"[Tools] '{tool_name}' quarantined for {QUARANTINE_SECONDS} s "
+                          f"after {stats.consecutive_timeouts} consecutive timeouts.")
+            return f"Error: Tool '{tool_name}' did not respond within {deadline:.1f} seconds. The result was discarded."
+
+    @staticmethod
+    def _log_background_result(tool_name, future):
+        try:
+            result = future.result()
+            if result and "Error" in result:
+                print(f"[Tools] Background tool '{tool_name}' reported: {result}")
+        except Exception as e:
+            print(f"[Tools] Background tool '{tool_name}' failed: {e}")
+
+    # --- Stats ---
+    def stats(self):
+        """Returns per-tool counters and latency histograms ({"<=5ms": n, ..., ">5000ms": n})."""
+        labels = [f"<={b}ms" for b in HISTOGRAM_BUCKETS_MS] + [f">{HISTOGRAM_BUCKETS_MS[-1]}ms"]
+        now = time.monotonic()
+        with self._lock:
+            return {
+                name: {
+                    "calls": s.calls,
+                    "completed": s.completed,
+                    "timeouts": s.timeouts,
+                    "late_results": s.late_results,
+                    "errors": s.errors,
+                    "quarantined": now < s.quarantined_until,
+                    "latency_histogram": {label: n for label, n in zip(labels, s.histogram) if n},
+                }
+                for name, s in self._stats.items()
+            }
+
+    def format_stats(self):
+        lines = ["Tool execution stats:"]
+        for name, s in self.stats().items():
+            lines.append(f"  {name}: {s['calls']} call(s), {s['timeouts']} timeout(s), "
+                         f"{s['late_results']} late, {s['errors']} error(s)"
+                         f"{' [QUARANTINED]' if s['quarantined'] else ''} {s['latency_histogram']}")
+        return "\n".join(lines)
+
+    def shutdown(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+
+# --- Self-test ---
+if __name__ == '__main__':
+    def _fake_tools(tool_name, parameters):
+        if tool_name == "get_disk_usage":
+            time.sleep(parameters.get("hang", 0))
+        return f"Result: {tool_name} ok"
+
+    TOOL_DEADLINES["get_disk_usage"] = 0.2
+    executor = ToolExecutor(_fake_tools)
+    print(executor.execute("get_current_datetime", {}))
+    print(executor.execute("send_notification", {"message": "hi"}))
+    for _ in range(3):
+        start = time.perf_counter()
+        print(executor.execute("get_disk_usage", {"hang": 0.5}), f"({(time.perf_counter() - start) * 1000:.0f} ms)")
+    time.sleep(0.6)
+    print(executor.format_stats())
+    executor.shutdown()
@@ -0,0 +1,425 @@
+# tts_backends.py
+# Common interface over the available Text-to-Speech engines.
+# main.py talks to a backend object (speak / stop / wait_until_done) instead of a specific module,
+# so a missing Piper model degrades to a local pyttsx3 voice instead of going silent.
+
+import os
+import queue
+import shutil
+import threading
+import time
+
+# --- Configuration ---
+# Backends to try, in order of preference. "print" (console only) is always the last resort.
+BACKEND_PREFERENCE = ["piper", "pyttsx3"]
+
+# pyttsx3 voice settings. Available voices vary wildly by OS; run ttsx3.py to list them.
+PYTTSX3_VOICE_INDEX = 1
+PYTTSX3_RATE = 160 # Words per minute
+PYTTSX3_VOLUME = 1.0 # 0.0 to 1.0
+
+# How long to wait for pyttsx3 to initialize in its worker thread before giving up on it.
+PYTTSX3_INIT_TIMEOUT = 5.0
+
+# After Piper fails, it's skipped for PIPER_RETRY_AFTER seconds, doubling with each failure in a
+# row up to PIPER_RETRY_MAX. One utterance that goes through resets the delay.
+PIPER_RETRY_AFTER = 30.0
+PIPER_RETRY_MAX = 600.0
+
+
+class TTSBackend:
+    """Base class. speak() must return quickly; audio plays in the background."""
+    name = "base"
+    # Set by FallbackTTS: called with (backend, text) when speech fails after speak() returned
+    on_speech_failed = None
+
+    def is_available(self):
+        """True if this backend can speak right now."""
+        return False
+
+    def unavailable_reason(self):
+        """Human-readable reason why is_available() is False."""
+        return "Not implemented."
+
+    def speak(self, text):
+        raise NotImplementedError
+
+    def stop(self):
+        """Interrupts current speech and drops anything queued."""
+        pass
+
+    def wait_until_done(self, timeout=None):
+        """Blocks until queued speech has finished. Returns False on timeout."""
+        return True
+
+    def is_speaking(self):
+        """True while speech is queued or playing."""
+        return False
+
+    def render_clip(self, text):
+        """
+        Pre-renders text for instant playback later: (pcm_bytes, sample_rate) of int16 mono audio
+        that can go straight into audio_playback.get_engine(). None if the backend can't do that.
+        """
+        return None
+
+    def stats(self):
+        """Backend-specific statistics (playback queue, synthesis speed...), or None."""
+        return None
+
+    def format_stats(self):
+        """stats() as printable text, or None if there is nothing to report."""
+        return None
+
+    def shutdown(self):
+        pass
+
+
+# --- Piper ---
+class PiperBackend(TTSBackend):
+    """Wraps tts_piper (or the tracked tts_piper_s template if no local copy exists)."""
+    name = "piper"
+
+    def __init__(self):
+        self.module = None
+        self._import_error = None
+        try:
+            import tts_piper as module
+        except ImportError:
+            try:
+                import tts_piper_s as module
+            except ImportError as e:
+                module = None
+                self._import_error = e
+        self.module = module
+        self._used = False # Set by the first speak()
+        if module is not None and hasattr(module, "on_speech_failed"):
+            module.on_speech_failed = self._speech_failed
+
+    def _speech_failed(self, text):
+        if self.on_speech_failed:
+            self.on_speech_failed(self, text)
+
+    def retry_in(self):
+        """Seconds until Piper is tried again after recent failures, 0 if it's not backing off."""
+        failures = getattr(self.module, "consecutive_failures", 0)
+        if not failures:
+            return 0.0
+        delay = min(PIPER_RETRY_AFTER * 2 ** (failures - 1), PIPER_RETRY_MAX)
+        return max(0.0, delay - (time.monotonic() - self.module.last_error_time))
+
+    def unavailable_reason(self):
+        if self.module is None:
+            return f"Could not import Piper TTS module ({self._import_error})."
+        exe = self.module.PIPER_EXE or shutil.which("piper")
+        if not exe:
+            return "Piper executable not found in PATH and not set in tts_piper.py."
+        if not os.path.isfile(self.module.VOICE_MODEL):
+            return f"Piper voice model not found at '{self.module.VOICE_MODEL}'."
+        if not os.path.isfile(self.module.VOICE_CONFIG):
+            return f"Piper voice config not found at '{self.module.VOICE_CONFIG}'."
+        # Synthesis runs on a background worker, so its failures can't raise out of speak()
+        if self.retry_in() > 0:
+            return (f"Piper failed {self.module.consecutive_failures} time(s) in a row "
+                    f"({self.module.last_error}), backing off.")
+        return None
+
+    def is_available(self):
+        return self.unavailable_reason() is None
+
+    def speak(self, text):
+        self._used = True
+        self.module.speak(text)
+
+    def stop(self):
+        stop_fn = getattr(self.module, "stop_speaking", None)
+        if stop_fn:
+            stop_fn()
+
+    def wait_until_done(self, timeout=None):
+        wait_fn = getattr(self.module, "wait_until_done", None)
+        return wait_fn(timeout=timeout) if wait_fn else True
+
+    def is_speaking(self):
+        speaking_fn = getattr(self.module, "is_speaking", None)
+        return speaking_fn() if speaking_fn else False
+
+    def render_clip(self, text):
+        render_fn = getattr(self.module, "render_clip", None)
+        if not render_fn or not getattr(self.module, "USE_PLAYBACK_ENGINE", False):
+            return None # Clips need the streaming playback engine
+        pcm = render_fn(text)
+        return (pcm, self.module.get_output_sample_rate()) if pcm else None
+
+    def stats(self):
+        if not self._used:
+            return None # Asking for playback stats would open an audio device just to report nothing
+        stats = {}
+        playback_fn = getattr(self.module, "get_playback_stats", None)
+        synthesis_fn = getattr(self.module, "get_synthesis_stats", None)
+        playback = playback_fn() if playback_fn else None
+        synthesis = synthesis_fn() if synthesis_fn else None
+        if playback:
+            stats["playback"] = playback
+        if synthesis:
+            stats["synthesis"] = synthesis
+        return stats or None
+
+    def format_stats(self):
+        stats = self.stats()
+        if not stats:
+            return None
+        lines = []
+        playback = stats.get("playback")
+        if playback and playback["played_ms"]:
+            lines.append(f"Piper playback: {playback['played_ms'] / 1000:.1f}s played, {playback['underruns']} underrun(s), "
+                         f"{playback['cancels']} barge-in(s), max queue {playback['max_queue_ms']:.0f} ms")
+        synthesis = stats.get("synthesis")
+        if synthesis and synthesis["workers"]:
+            workers = ", ".join(f"{name} {w['rtf']} ({w['sentences']} sentence(s))"
+                                for name, w in synthesis["workers"].items())
+            lines.append(f"Piper synthesis pool ({synthesis['pool_size']} worker(s)): overall RTF {synthesis['overall_rtf']}, "
+                         f"first audio after {synthesis['avg_first_audio_ms']} ms on average; per worker RTF: {workers}")
+        return "\n".join(lines) or None
+
+
+# --- pyttsx3 ---
+class Pyttsx3Backend(TTSBackend):
+    """
+    Runs pyttsx3 on a dedicated worker thread with its own non-blocking run loop
+    (startLoop(False) + iterate()), fed through a command queue. speak() never blocks.
+    The engine is created inside the worker, since some drivers (SAPI5) are thread-bound.
+    """
+    name = "pyttsx3"
+
+    def __init__(self, voice_index=None, rate=None, volume=None):
+        self.voice_index = PYTTSX3_VOICE_INDEX if voice_index is None else voice_index
+        self.rate = PYTTSX3_RATE if rate is None else rate
+        self.volume = PYTTSX3_VOLUME if volume is None else volume
+        self._commands = queue.Queue()
+        self._ready = threading.Event()
+        self._idle = threading.Event()
+        self._idle.set()
+        self._error = None
+        self._thread = None
+
+    def _ensure_started(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="Pyttsx3Worker", daemon=True)
+            self._thread.start()
+            self._ready.wait(timeout=PYTTSX3_INIT_TIMEOUT)
+            if not self._ready.is_set() and self._error is None:
+                self._error = "Timed out initializing pyttsx3."
+
+    def _run(self):
+        try:
+            import pyttsx3
+            engine = pyttsx3.init()
+            voices = engine.getProperty('voices')
+            if voices and 0 <= self.voice_index < len(voices):
+                engine.setProperty('voice', voices[self.voice_index].id)
+            engine.setProperty('rate', self.rate)
+            engine.setProperty('volume', self.volume)
+            engine.startLoop(False)
+        except Exception as e:
+            self._error = f"Error initializing pyttsx3: {e}"
+            self._ready.set()
+            return
+        self._ready.set()
+
+        try:
+            while True:
+                # Drain every pending command, then pump the driver once
+                try:
+                    while True:
+                        command, arg = self._commands.get_nowait()
+                        if command == "say":
+                            self._idle.clear()
+                            engine.say(arg)
+                        elif command == "stop":
+                            engine.stop()
+                        elif command == "shutdown":
+                            return
+                except queue.Empty:
+                    pass
+                engine.iterate()
+                if not engine.isBusy() and self._commands.empty():
+                    self._idle.set()
+                time.sleep(0.01)
+        except Exception as e:
+            print(f"\nError in pyttsx3 worker: {e}")
+            self._error = f"pyttsx3 worker stopped: {e}"
+        finally:
+            self._idle.set()
+            try:
+                engine.endLoop()
+            except Exception:
+                pass
+
+    def unavailable_reason(self):
+        try:
+            import pyttsx3 # noqa: F401
+        except ImportError:
+            return "'pyttsx3' library not found. Install with: pip install pyttsx3"
+        self._ensure_started()
+        return self._error
+
+    def is_available(self):
+        return self.unavailable_reason() is None
+
+    def speak(self, text):
+        self._ensure_started()
+        print(f"\nGLaDOS: {text}")
+        self._idle.clear()
+        self._commands.put(("say", text))
+
+    def stop(self):
+        if self._thread is not None:
+            self._commands.put(("stop", None))
+
+    def wait_until_done(self, timeout=None):
+        return self._idle.wait(timeout=timeout)
+
+    def is_speaking(self):
+        return not self._idle.is_set()
+
+    def shutdown(self):
+        if self._thread is not None:
+            self._commands.put(("shutdown", None))
+            self._thread.join(timeout=2.0)
+
+
+# --- Console Only ---
+class PrintBackend(TTSBackend):
+    """Last resort: prints the text."""
+    name = "print"
+
+    def is_available(self):
+        return True
+
+    def unavailable_reason(self):
+        return None
+
+    def speak(self, text):
+        print(f"Assistant (TTS Disabled): {text}")
+
+
+# --- Selection / Fallback ---
+BACKEND_CLASSES = {
+    "piper": PiperBackend,
+    "pyttsx3": Pyttsx3Backend,
+    "print": PrintBackend,
+}
+
+
+class FallbackTTS(TTSBackend):
+    """
+    Picks the first available backend at call time. If the active backend becomes unavailable
+    (e.g. the Piper model was moved) or raises, the next one in line takes over. An utterance
+    that fails in the background is repeated on the next backend, and a preferred backend that
+    recovers (Piper after its retry delay) takes over again on the next speak().
+    """
+    name = "fallback"
+
+    def __init__(self, preference=None):
+        names = list(preference or BACKEND_PREFERENCE)
+        if "print" not in names:
+            names.append("print")
+        self.backends = []
+        for backend_name in names:
+            cls = BACKEND_CLASSES.get(backend_name)
+            if cls is None:
+                print(f"Warning: Unknown TTS backend '{backend_name}' ignored.")
+                continue
+            backend = cls()
+            backend.on_speech_failed = self._speech_failed
+            self.backends.append(backend)
+        self.active = None
+        self._reported = {} # Backend name -> last logged unavailable reason
+        self._lock = threading.RLock()
+        self._select()
+
+    def _select(self):
+        """Activates the first available backend, logging why earlier ones were skipped (once per reason)."""
+        with self._lock:
+            for backend in self.backends:
+                reason = backend.unavailable_reason()
+                if reason is None:
+                    self._reported.pop(backend.name, None)
+                    if backend is not self.active:
+                        print(f"TTS backend: {backend.name}")
+                    self.active = backend
+                    return backend
+                if self._reported.get(backend.name) != reason:
+                    print(f"TTS backend '{backend.name}' unavailable: {reason}")
+                    self._reported[backend.name] = reason
+            return self.active
+
+    def _speech_failed(self, failed, text):
+        """Runs on the failed backend's worker thread: says the lost utterance with the next backend."""
+        backend = self._select()
+        if backend is failed or backend is None:
+            return
+        print(f"TTS backend '{failed.name}' failed; repeating on '{backend.name}'.")
+        backend.speak(text)
+
+    @property
+    def active_name(self):
+        return self.active.name if self.active else None
+
+    def is_available(self):
+        return True
+
+    def unavailable_reason(self):
+        return None
+
+    def speak(self, text):
+        self._select() # Also switches back to a preferred backend that has recovered
+        try:
+            self.active.speak(text)
+        except Exception as e:
+            failed = self.active
+            print(f"\nError in TTS backend '{failed.name}': {e}. Falling back.")
+            self.backends = [b for b in self.backends if b is not failed]
+            self.active = None
+            self._select()
+            self.active.speak(text)
+
+    def stop(self):
+        if self.active:
+            self.active.stop()
+
+    def wait_until_done(self, timeout=None):
+        return self.active.wait_until_done(timeout=timeout) if self.active else True
+
+    def is_speaking(self):
+        return self.active.is_speaking() if self.active else False
+
+    def render_clip(self, text):
+        return self.active.render_clip(text) if self.active else None
+
+    def stats(self):
+        """Per backend name, for every backend that has anything to report."""
+        stats = {backend.name: backend.stats() for backend in self.backends}
+        return {name: s for name, s in stats.items() if s} or None
+
+    def format_stats(self):
+        lines = [backend.format_stats() for backend in self.backends]
+        return "\n".join(line for line in lines if line) or None
+
+    def shutdown(self):
+        for backend in self.backends:
+            backend.shutdown()
+
+
+def select_backend(preference=None):
+    """Returns a FallbackTTS over the preferred backends."""
+    return FallbackTTS(preference)
+
+
+# --- Self-test ---
+if __name__ == '__main__':
+    tts = select_backend()
+    tts.speak("Backend check. If you can hear this, at least one of us is working.")
+    tts.wait_until_done(timeout=15)
+    tts.shutdown()
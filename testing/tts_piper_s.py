@@ -1,10 +1,15 @@
 # tts_piper.py
 # Handles Text-to-Speech using the Piper TTS engine.
 
+import atexit
 import subprocess
 import shutil
 import os
 import platform
+import json
+import queue
+import threading
+import time
 
 # --- Configuration ---
 # Option 1: Assume 'piper' is in the system PATH
@@ -16,15 +21,51 @@ PIPER_EXE = shutil.which("piper")
 # Path to the downloaded Piper voice model (.onnx file)
 # Download voices from: https://huggingface.co/rhasspy/piper-voices/tree/main
 # Example: VOICE_MODEL = "./models/en_US-lessac-medium.onnx"
-VOICE_MODEL = "C:\Users\RYakunin\Documents\Projects\familiar\voices\glados\en-us-glados-high.onnx"
+VOICE_MODEL = r"C:\Users\RYakunin\Documents\Projects\familiar\voices\glados\en-us-glados-high.onnx"
 
 # Path to the corresponding voice config file (.json file)
 # Example: VOICE_CONFIG = "./models/en_US-lessac-medium.onnx.json"
-VOICE_CONFIG = "C:\Users\RYakunin\Documents\Projects\familiar\voices\glados\en-us-glados-high.onnx.json"
+VOICE_CONFIG = r"C:\Users\RYakunin\Documents\Projects\familiar\voices\glados\en-us-glados-high.onnx.json"
 
 # --- Audio Playback Setup ---
 # Choose ONE method for playing the generated WAV file.
 
+# Method C (preferred): Persistent playback engine (audio_playback.py)
+# Piper streams raw PCM straight into one long-lived output stream: no temporary WAV file,
+# no new audio device per clip, and speech can be cut off with stop_speaking().
+# Falls back to Method A/B below if the module can't be imported.
+USE_PLAYBACK_ENGINE = True
+try:
+    import audio_playback
+except ImportError as e:
+    print(f"Warning: Could not import audio_playback.py ({e}). Falling back to file-based playback.")
+    USE_PLAYBACK_ENGINE = False
+
+# Long replies are split into sentences and synthesized in parallel (synth_pool.py) on warm
+# Piper workers that keep the model loaded. Single sentences still stream directly.
+USE_SYNTH_POOL = True
+try:
+    import synth_pool
+except ImportError as e:
+    print(f"Warning: Could not import synth_pool.py ({e}). Sentences will be synthesized one at a time.")
+    USE_SYNTH_POOL = False
+
+# In-process post-processing between Piper and playback (audio_dsp.py, needs numpy):
+# gain normalization, a light ring-mod effect, silence trimming and resampling.
+USE_AUDIO_DSP = True
+OUTPUT_SAMPLE_RATE = None # Output device rate, e.g. 48000. None = keep the voice's native rate
+try:
+    import audio_dsp
+    if not audio_dsp.NUMPY_AVAILABLE:
+        USE_AUDIO_DSP = False
+except ImportError as e:
+    print(f"Warning: Could not import audio_dsp.py ({e}). Audio post-processing disabled.")
+    USE_AUDIO_DSP = False
+
+# With the playback engine, speak() returns as soon as the text is queued so the user can type
+# (and interrupt) while audio is still playing. Set to True to wait for speech to finish.
+SPEAK_BLOCKING = False
+
 # Method A: Using 'playsound' library (cross-platform, simple)
 # Install: pip install playsound
 USE_PLAYSOUND = True
@@ -49,6 +90,293 @@ elif platform.system() == "Windows":
     # PLAYER_COMMAND = 'vlc --play-and-exit {}' # Requires VLC installed
     pass # Stick to playsound on Windows unless specifically configured
 
+# --- Streaming Playback (Method C) ---
+_voice_sample_rate = None
+_speech_queue = queue.Queue() # (generation, text) waiting to be synthesized, in order
+_speech_worker = None
+_active_process = None # The Piper process currently streaming audio, if any
+_process_lock = threading.Lock()
+# Piper failures (bad model, non-zero exit...). Failures on the speech worker can't raise into
+# speak(), so tts_backends reads these to fall back for a while, with a growing retry delay.
+last_error = None
+last_error_time = 0.0 # time.monotonic() of the last failure
+consecutive_failures = 0 # Utterances in a row that hit a failure. Reset by one that didn't
+on_speech_failed = None # Called with the text of each utterance Piper failed to speak
+_failure_count = 0 # Every failure, so the worker can tell whether an utterance hit one
+
+
+def _record_error(message):
+    global last_error, last_error_time, _failure_count
+    last_error = message
+    last_error_time = time.monotonic()
+    _failure_count += 1
+    print(f"\nError: {message}")
+
+
+def _record_outcome(failed):
+    """Counts one utterance towards consecutive_failures, or resets it."""
+    global last_error, consecutive_failures
+    if failed:
+        consecutive_failures += 1
+    else:
+        last_error = None
+        consecutive_failures = 0
+
+
+def _speech_failed(text):
+    """An utterance couldn't be spoken: counts the failure and hands the text to on_speech_failed."""
+    _record_outcome(failed=True)
+    if on_speech_failed:
+        on_speech_failed(text) # Lets tts_backends say it with another voice
+
+
+def get_voice_sample_rate():
+    """Reads the output sample rate from the voice config (cached). Defaults to 22050 Hz."""
+    global _voice_sample_rate
+    if _voice_sample_rate is None:
+        _voice_sample_rate = 22050
+        try:
+            with open(VOICE_CONFIG, "r", encoding="utf-8") as f:
+                _voice_sample_rate = int(json.load(f).get("audio", {}).get("sample_rate", 22050))
+        except (OSError, ValueError, TypeError) as e:
+            print(f"Warning: Could not read sample rate from '{VOICE_CONFIG}' ({e}). Assuming 22050 Hz.")
+    return _voice_sample_rate
+
+
+def get_output_sample_rate():
+    """Sample rate the playback engine runs at (after any resampling)."""
+    if USE_AUDIO_DSP and OUTPUT_SAMPLE_RATE:
+        return OUTPUT_SAMPLE_RATE
+    return get_voice_sample_rate()
+
+
+_dsp_chain = None
+
+
+def _get_dsp_chain():
+    """Returns the shared post-processing chain, or None if disabled. Only used by the speech worker."""
+    global _dsp_chain
+    if not USE_AUDIO_DSP:
+        return None
+    if _dsp_chain is None:
+        _dsp_chain = audio_dsp.DSPChain(get_voice_sample_rate(), get_output_sample_rate())
+    return _dsp_chain
+
+
+def _stream_piper(text, engine, generation):
+    """Runs Piper with raw output and feeds the PCM into the playback engine as it arrives."""
+    global _active_process
+    command = [
+        PIPER_EXE,
+        "--model", VOICE_MODEL,
+        "--config", VOICE_CONFIG,
+        "--output_raw"
+    ]
+    try:
+        process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    except FileNotFoundError:
+        _record_error(f"Could not execute Piper. Is '{PIPER_EXE}' the correct path?")
+        return
+    with _process_lock:
+        _active_process = process
+
+    try:
+        process.stdin.write(text.encode('utf-8'))
+        process.stdin.close()
+
+        dsp = _get_dsp_chain()
+        if dsp:
+            dsp.reset()
+        leftover = b"" # Keep int16 samples whole across reads
+        while True:
+            chunk = process.stdout.read1(8192)
+            if not chunk:
+                break
+            if engine.generation != generation:
+                process.kill() # Barge-in: nobody wants the rest of this sentence
+                break
+            chunk = leftover + chunk
+            usable = len(chunk) - (len(chunk) % 2)
+            leftover = chunk[usable:]
+            if dsp:
+                for processed in dsp.process_iter(chunk[:usable]):
+                    engine.enqueue(processed)
+            else:
+                engine.enqueue(chunk[:usable])
+        if dsp and engine.generation == generation:
+            engine.enqueue(dsp.flush())
+
+        process.wait()
+        if process.returncode != 0 and engine.generation == generation: # A killed (barged-in) process isn't a failure
+            stderr = process.stderr.read().decode('utf-8', errors='ignore').strip()
+            _record_error(f"Piper TTS exited with return code {process.returncode}. Stderr: {stderr}")
+    except Exception as e:
+        _record_error(f"Unexpected error during Piper TTS streaming: {e}")
+    finally:
+        with _process_lock:
+            if _active_process is process:
+                _active_process = None
+        if engine.generation == generation:
+            engine.end_stream()
+
+
+def synthesize_pcm(text):
+    """Synthesizes text with a one-off Piper process and returns raw int16 PCM bytes (blocking)."""
+    command = [
+        PIPER_EXE,
+        "--model", VOICE_MODEL,
+        "--config", VOICE_CONFIG,
+        "--output_raw"
+    ]
+    try:
+        process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    except FileNotFoundError:
+        _record_error(f"Could not execute Piper. Is '{PIPER_EXE}' the correct path?")
+        return b""
+    stdout, stderr = process.communicate(input=text.encode('utf-8'))
+    if process.returncode != 0:
+        _record_error(f"Piper TTS exited with return code {process.returncode}. "
+                      f"Stderr: {stderr.decode('utf-8', errors='ignore').strip()}")
+        return b""
+    return stdout[:len(stdout) - (len(stdout) % 2)]
+
+
+def render_clip(text):
+    """
+    Synthesizes a short clip to int16 PCM at the playback rate, post-processed like normal speech.
+    Used to pre-render audio that must start instantly later (e.g. latency-masking fillers).
+    """
+    pcm = synthesize_pcm(text) # One-off process: pre-rendering isn't speech, so barge-in doesn't touch it
+    if pcm and USE_AUDIO_DSP:
+        dsp = audio_dsp.DSPChain(get_voice_sample_rate(), get_output_sample_rate()) # Own chain: the shared one belongs to the speech worker
+        pcm = dsp.process(pcm) + dsp.flush()
+    return pcm
+
+
+_scheduler = None
+_worker_pool = None
+
+
+def _synthesize_pooled(text):
+    """Scheduler task: one sentence on the calling thread's warm worker. b"" if cancelled or failed."""
+    try:
+        return _worker_pool.synthesize(text) or b""
+    except synth_pool.PiperWorkerError as e:
+        _record_error(str(e))
+        return b""
+
+
+def get_synthesis_scheduler():
+    """Returns the shared parallel synthesis scheduler (starting its warm workers), or None if it's disabled."""
+    global _scheduler, _worker_pool
+    if not USE_SYNTH_POOL:
+        return None
+    if _scheduler is None:
+        _worker_pool = synth_pool.PiperWorkerPool([PIPER_EXE, "--model", VOICE_MODEL, "--config", VOICE_CONFIG])
+        _worker_pool.prewarm()
+        atexit.register(_worker_pool.close)
+        _scheduler = synth_pool.SynthesisScheduler(_synthesize_pooled, get_voice_sample_rate(),
+                                                   pool_size=_worker_pool.size)
+    return _scheduler
+
+
+def get_synthesis_stats():
+    """Returns per-worker and overall real-time factors, or None if the pool is unused."""
+    if not _scheduler:
+        return None
+    stats = _scheduler.stats()
+    stats["piper_workers"] = _worker_pool.stats()
+    return stats
+
+
+def _speech_worker_loop():
+    """Synthesizes queued utterances one at a time so their audio never interleaves."""
+    while True:
+        generation, text = _speech_queue.get()
+        failures_before = _failure_count
+        try:
+            engine = audio_playback.get_engine(get_output_sample_rate())
+            if generation != engine.generation: # Skip anything queued before a stop_speaking()
+                continue
+            try:
+                scheduler = get_synthesis_scheduler()
+                if scheduler and len(synth_pool.split_sentences(text)) > 1:
+                    scheduler.speak(text, engine, generation, dsp=_get_dsp_chain())
+                else:
+                    _stream_piper(text, engine, generation)
+            except Exception as e: # Keep the worker alive
+                _record_error(f"Speech worker failed: {e}")
+            if _failure_count == failures_before:
+                _record_outcome(failed=False)
+            elif engine.generation == generation:
+                _speech_failed(text)
+            else:
+                _record_outcome(failed=True) # Interrupted anyway, nothing to repeat
+        except Exception as e:
+            print(f"\nError in Piper speech worker: {e}")
+        finally:
+            _speech_queue.task_done()
+
+
+def _queue_speech(text):
+    """Hands text to the background speech worker, starting it on first use."""
+    global _speech_worker
+    if _speech_worker is None or not _speech_worker.is_alive():
+        _speech_worker = threading.Thread(target=_speech_worker_loop, name="PiperSpeechWorker", daemon=True)
+        _speech_worker.start()
+    engine = audio_playback.get_engine(get_output_sample_rate())
+    _speech_queue.put((engine.generation, text))
+
+
+def stop_speaking():
+    """Interrupts current speech immediately and drops anything still queued (barge-in)."""
+    if not USE_PLAYBACK_ENGINE:
+        return
+    while True:
+        try:
+            _speech_queue.get_nowait()
+            _speech_queue.task_done()
+        except queue.Empty:
+            break
+    audio_playback.get_engine().cancel()
+    with _process_lock:
+        process = _active_process
+    if process is not None:
+        try:
+            process.kill()
+        except OSError:
+            pass
+    if _worker_pool:
+        _worker_pool.abort() # Kills sentences mid-synthesis; the workers restart warm in the background
+
+
+def is_speaking():
+    """True while speech is queued, being synthesized or playing."""
+    if not USE_PLAYBACK_ENGINE:
+        return False
+    return _speech_queue.unfinished_tasks > 0 or audio_playback.get_engine().is_busy()
+
+
+def wait_until_done(timeout=None):
+    """Blocks until all queued speech has been synthesized and played."""
+    if not USE_PLAYBACK_ENGINE:
+        return True
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while _speech_queue.unfinished_tasks: # Queue.join() has no timeout
+        if deadline is not None and time.monotonic() >= deadline:
+            return False
+        time.sleep(0.02)
+    remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+    return audio_playback.get_engine().wait(timeout=remaining)
+
+
+def get_playback_stats():
+    """Returns playback engine statistics (queue depth, underruns...), or None without the engine."""
+    if not USE_PLAYBACK_ENGINE:
+        return None
+    return audio_playback.get_engine().stats()
+
+
 # --- TTS Function ---
 
 def speak(text, output_file="glados_output.wav"):
@@ -76,6 +404,13 @@ def speak(text, output_file="glados_output.wav"):
 
     print(f"\nGLaDOS: {text}") # Print the text regardless
 
+    # --- Streaming path: synthesize straight into the persistent output stream ---
+    if USE_PLAYBACK_ENGINE:
+        _queue_speech(text)
+        if SPEAK_BLOCKING:
+            wait_until_done()
+        return
+
     # --- Generate Audio ---
     try:
         # Construct the command carefully
@@ -90,16 +425,20 @@ def speak(text, output_file="glados_output.wav"):
         stdout, stderr = process.communicate(input=text.encode('utf-8'))
 
         if process.returncode != 0:
-            print(f"Error running Piper TTS (Return Code: {process.returncode}):")
-            print(f"Stderr: {stderr.decode('utf-8', errors='ignore')}")
+            _record_error(f"Piper TTS exited with return code {process.returncode}. "
+                          f"Stderr: {stderr.decode('utf-8', errors='ignore').strip()}")
+            _speech_failed(text)
             return # Don't try to play a potentially non-existent/corrupt file
 
     except FileNotFoundError:
-         print(f"\nError: Could not execute Piper. Is '{PIPER_EXE}' the correct path?")
+         _record_error(f"Could not execute Piper. Is '{PIPER_EXE}' the correct path?")
+         _speech_failed(text)
          return
     except Exception as e:
-        print(f"\nAn unexpected error occurred during Piper TTS generation: {e}")
+        _record_error(f"Unexpected error during Piper TTS generation: {e}")
+        _speech_failed(text)
         return
+    _record_outcome(failed=False)
 
     # --- Play Audio ---
     if not os.path.exists(output_file):
@@ -130,8 +469,48 @@ def speak(text, output_file="glados_output.wav"):
         except OSError as e:
             print(f"\nWarning: Could not remove temporary audio file '{output_file}': {e}")
 
+def benchmark_rtf(text):
+    """
+    Real-time factor (synthesis wall time / audio duration, lower is better) of the single-process
+    streaming path against the warm worker pool, on the same text. Audio goes to a silent sink.
+    """
+    results = {}
+    engine = audio_playback.PlaybackEngine(sink=audio_playback.NullSink(), sample_rate=get_output_sample_rate())
+    scheduler = get_synthesis_scheduler()
+    if scheduler:
+        _worker_pool.prewarm(background=False)
+    paths = [("streaming", lambda: _stream_piper(text, engine, engine.generation))]
+    if scheduler:
+        paths.append(("pool", lambda: scheduler.speak(text, engine, dsp=_get_dsp_chain())))
+    for name, run in paths:
+        played_before = engine.played_bytes
+        start = time.perf_counter()
+        run()
+        elapsed = time.perf_counter() - start
+        engine.wait()
+        audio_seconds = (engine.played_bytes - played_before) / (engine.sample_rate * audio_playback.SAMPLE_WIDTH)
+        results[name] = round(elapsed / audio_seconds, 3) if audio_seconds else None
+    engine.close()
+    return results
+
+
 # --- Self-test (optional) ---
+# "python tts_piper_s.py --benchmark" compares the streaming path with the worker pool instead.
 if __name__ == '__main__':
+    import sys
+    if "--benchmark" in sys.argv:
+        monologue = ("Hello, and again, welcome to the Aperture Science computer-aided enrichment center. "
+                     "We hope your brief detention in the relaxation vault has been a pleasant one. "
+                     "Your specimen has been processed and we are now ready to begin the test proper. "
+                     "Before we start, however, keep in mind that although fun and learning are the primary goals "
+                     "of all enrichment center activities, serious injuries may occur.")
+        print(f"Real-time factor: {benchmark_rtf(monologue)}")
+        print(f"Synthesis stats: {get_synthesis_stats()}")
+        sys.exit(0)
     print("Testing Piper TTS...")
     speak("This is only a test. Had this been an actual emergency, something probably would have exploded by now.")
+    wait_until_done()
+    if USE_PLAYBACK_ENGINE:
+        print(f"Playback stats: {get_playback_stats()}")
+        print(f"Synthesis stats: {get_synthesis_stats()}")
     print("Test complete.")
\ No newline at end of file
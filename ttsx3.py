@@ -1,25 +1,42 @@
-import pyttsx3
+try:
+    import pyttsx3
+except ImportError:
+    pyttsx3 = None
+    print("Warning: 'pyttsx3' library not found. Install with: pip install pyttsx3")
 
 engine = None
-try:
-    engine = pyttsx3.init()
-    # --- Voice Customization (Limited) ---
-    voices = engine.getProperty('voices')
-    # Try finding a voice you prefer - this varies wildly by OS
-    print("Available voices:")
-    for i, voice in enumerate(voices):
-        print(f"{i}: {voice.id} - {voice.name}")
-    # Choose a voice index (e.g., 0, 1, etc.) or ID
-    engine.setProperty('voice', voices[1].id) # Example: select second voice
 
-    engine.setProperty('rate', 160) # Adjust speed (words per minute)
-    engine.setProperty('volume', 1.0) # Volume (0.0 to 1.0)
+def init_engine(voice_index=1, rate=160, volume=1.0, list_voices=False):
+    # Initialization is deferred until first use so importing this file has no side effects.
+    # The non-blocking, threaded version used by the assistant lives in testing/tts_backends.py.
+    global engine
+    if pyttsx3 is None:
+        return None
+    try:
+        engine = pyttsx3.init()
+        # --- Voice Customization (Limited) ---
+        voices = engine.getProperty('voices')
+        # Try finding a voice you prefer - this varies wildly by OS
+        if list_voices:
+            print("Available voices:")
+            for i, voice in enumerate(voices):
+                print(f"{i}: {voice.id} - {voice.name}")
+        # Choose a voice index (e.g., 0, 1, etc.) or ID
+        if voices and 0 <= voice_index < len(voices):
+            engine.setProperty('voice', voices[voice_index].id) # Example: select second voice
+
+        engine.setProperty('rate', rate) # Adjust speed (words per minute)
+        engine.setProperty('volume', volume) # Volume (0.0 to 1.0)
 
-except Exception as e:
-    print(f"Error initializing TTS engine: {e}")
-    print("Text-to-speech might not be available.")
+    except Exception as e:
+        engine = None
+        print(f"Error initializing TTS engine: {e}")
+        print("Text-to-speech might not be available.")
+    return engine
 
 def speak(text):
+    if engine is None:
+        init_engine()
     if engine:
         print(f"GLaDOS: {text}") # Also print to console
         engine.say(text)
@@ -28,4 +45,6 @@ def speak(text):
         print(f"GLaDOS (TTS disabled): {text}")
 
 # Test it
-speak("Oh. It's you. It's been a long time.")
\ No newline at end of file
+if __name__ == '__main__':
+    init_engine(list_voices=True)
+    speak("Oh. It's you. It's been a long time.")